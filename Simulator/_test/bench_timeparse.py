@@ -0,0 +1,54 @@
+# Micro-benchmark: WTT time cell -> minutes since midnight.
+# strptime-based parser (previous StationEvent._timeToMinutes) vs
+# timetable.timeToMinutes and the batch timetable.seriesToMinutes, which
+# SheetIndex runs over the distinct time cells of each sheet.
+#
+# Run from Simulator/src: python3 ../_test/bench_timeparse.py
+import os
+import sys
+import timeit
+from datetime import datetime, time as dtime
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from timetable import timeToMinutes, seriesToMinutes
+
+def strptimeToMinutes(time_str):
+    if not time_str:
+        return None
+    try:
+        t = datetime.strptime(time_str.strip(), "%H:%M:%S")
+    except:
+        try:
+            t = datetime.strptime(time_str.strip(), "%H:%M")
+        except:
+            return None
+
+    minutes = t.hour * 60 + t.minute + t.second / 60
+    if minutes < 165:
+        minutes += 1440
+    return minutes
+
+N = 50_000
+cells = []
+for i in range(N):
+    h, m = (i // 60) % 24, i % 60
+    cells.append(f"{h:02d}:{m:02d}" if i % 3 else f"{h:02d}:{m:02d}:30")
+clocks = [dtime(int(c[:2]), int(c[3:5])) for c in cells]
+series = pd.Series(cells)
+
+assert [strptimeToMinutes(c) for c in cells] == [timeToMinutes(c) for c in cells]
+assert seriesToMinutes(series).tolist() == [timeToMinutes(c) for c in cells]
+
+def bench(label, fn, number=5):
+    best = min(timeit.repeat(fn, number=1, repeat=number))
+    print(f"{label:<36} {best * 1000:8.1f} ms  ({best / N * 1e9:6.0f} ns/cell)")
+    return best
+
+print(f"{N} cells")
+base = bench("strptime (old)", lambda: [strptimeToMinutes(c) for c in cells])
+fast = bench("timeToMinutes(str)", lambda: [timeToMinutes(c) for c in cells])
+bench("timeToMinutes(datetime.time)", lambda: [timeToMinutes(c) for c in clocks])
+batch = bench("seriesToMinutes(Series)", lambda: seriesToMinutes(series))
+print(f"speedup: scalar {base / fast:.1f}x, batch {base / batch:.1f}x")
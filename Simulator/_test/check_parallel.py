@@ -0,0 +1,41 @@
+# Check: registerServices in a process pool (WTT_PARSE_WORKERS > 1)
+# parses exactly the same services, rake links and station events as
+# the sequential parse.
+#
+# Run from Simulator/src: python3 ../_test/check_parallel.py <wtt.xlsx> <summary.xlsx> [workers]
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import timetable as tt
+
+def parse(fpWtt, fpSummary, workers):
+    tt.TimeTableParser.parseWorkers = workers
+    with open(fpWtt, "rb") as f1, open(fpSummary, "rb") as f2:
+        parser = tt.TimeTableParser.fromFileObjects(f1, f2, useCache=False)
+    wtt = parser.wtt
+    services = [(sv.direction, sv.colIdx, sv.serviceId, sv.linkedTo, sv.needsACRake, sv.rakeSizeReq, sv.type, sv.zone)
+                for sv in wtt.upServices + wtt.downServices]
+    wtt.generateRakeCycles()
+    return {
+        "services": services,
+        "records": tt.serviceRecords(wtt),
+        "cycles": tt.cycleRecords(wtt),
+        "events": tt.eventRecords(wtt),
+    }
+
+def check(fpWtt, fpSummary, workers):
+    sequential = parse(fpWtt, fpSummary, 0)
+    parallel = parse(fpWtt, fpSummary, workers)
+    for part in sequential:
+        a, b = sequential[part], parallel[part]
+        assert len(a) == len(b), f"{part}: {len(a)} sequential vs {len(b)} parallel"
+        for i, (x, y) in enumerate(zip(a, b)):
+            assert x == y, f"{part}[{i}] differs:\n  sequential {x}\n  parallel   {y}"
+        print(f"{part}: {len(a)} equal", file=sys.stderr)
+    print("ok", file=sys.stderr)
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        sys.exit("usage: check_parallel.py <wtt.xlsx> <summary.xlsx> [workers]")
+    check(sys.argv[1], sys.argv[2], int(sys.argv[3]) if len(sys.argv) == 4 else 4)
@@ -0,0 +1,73 @@
+# Check: window queries answered by the indexes (SpanIndex.overlapping,
+# EventTable.stationWindow and the TimeTable wrappers over them) against
+# a brute-force scan, on random spans and, if given, a parsed WTT.
+#
+# Run from Simulator/src: python3 ../_test/check_windows.py [<wtt.xlsx> <summary.xlsx>]
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import timetable as tt
+
+def randomWindows(rng, n, lo=150, hi=1650):
+    windows = [(a, a) for a in (lo, hi, 500.0)] # degenerate, edges
+    for _ in range(n):
+        a, b = sorted(rng.uniform(lo - 100, hi + 100) for _ in range(2))
+        windows.append((a, b))
+    return windows
+
+def checkSpanIndex(rng):
+    for size in (0, 1, 2, 7, 100, 2000):
+        starts = np.array([rng.choice([rng.uniform(150, 1600), float(rng.randrange(150, 1600))]) for _ in range(size)])
+        ends = starts + np.array([rng.choice([0.0, rng.uniform(0, 300)]) for _ in range(size)])
+        if size:
+            ends[rng.randrange(size)] = np.nan # untimed spans are never returned
+        index = tt.SpanIndex(starts, ends)
+        # also windows whose end points coincide with span end points
+        points = [t for t in np.concatenate([starts[:20], ends[:20]]) if not np.isnan(t)]
+        windows = randomWindows(rng, 200) + [(t, t) for t in points]
+        for lo, hi in windows:
+            expected = sorted(i for i in range(size) if starts[i] <= hi and ends[i] >= lo)
+            got = sorted(int(i) for i in index.overlapping(lo, hi))
+            assert got == expected, f"SpanIndex({size}) [{lo}, {hi}]: {got} != {expected}"
+    print("SpanIndex.overlapping: ok", file=sys.stderr)
+
+def checkTimeTable(fpWtt, fpSummary, rng):
+    with open(fpWtt, "rb") as f1, open(fpSummary, "rb") as f2:
+        parser = tt.TimeTableParser.fromFileObjects(f1, f2, useCache=False)
+    wtt = parser.wtt
+    wtt.generateRakeCycles()
+    services = wtt.eventTable.services
+    times = [e.atTime for sv in services for e in sv.events if e.atTime is not None]
+    windows = randomWindows(rng, 100) + [(t, t) for t in rng.sample(times, min(20, len(times)))]
+
+    for lo, hi in windows:
+        # services running in the window: first-to-last event span overlaps it
+        expected = []
+        for sv in services:
+            timed = [e.atTime for e in sv.events if e.atTime is not None]
+            if timed and min(timed) <= hi and max(timed) >= lo:
+                expected.append(id(sv))
+        got = [id(sv) for sv in wtt.servicesActive(lo, hi)]
+        assert sorted(got) == sorted(expected), f"servicesActive [{lo}, {hi}]: {len(got)} != {len(expected)}"
+
+        for stName in wtt.eventTable.stationNames:
+            expected = sorted(
+                (e for sv in services for e in sv.events
+                 if e.atStation == stName and e.atTime is not None and lo <= e.atTime <= hi),
+                key=lambda e: e.atTime)
+            got = wtt.stationEventsInWindow(stName, lo, hi)
+            assert [e.atTime for e in got] == [e.atTime for e in expected], f"stationEventsInWindow {stName} [{lo}, {hi}]"
+            assert {id(e) for e in got} == {id(e) for e in expected}, f"stationEventsInWindow {stName} [{lo}, {hi}]"
+    print(f"servicesActive, stationEventsInWindow: ok ({len(windows)} windows, {len(wtt.eventTable.stationNames)} stations)", file=sys.stderr)
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (1, 3):
+        sys.exit("usage: check_windows.py [<wtt.xlsx> <summary.xlsx>]")
+    rng = random.Random(19)
+    checkSpanIndex(rng)
+    if len(sys.argv) == 3:
+        checkTimeTable(sys.argv[1], sys.argv[2], rng)
@@ -0,0 +1,62 @@
+# Memory report: bytes held per Service / StationEvent after a full parse
+# and rake-cycle generation of a WTT.
+#
+# Run from Simulator/src: python3 ../_test/memreport.py <wtt.xlsx> <summary.xlsx>
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+import timetable as tt
+
+def objBytes(obj):
+    '''Size of the object itself plus its attribute dict, if it has one.'''
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+def sheetIndexBytes(wtt):
+    '''Arrays and string cells held by the timetable's sheet indexes.'''
+    size = 0
+    for sheetIdx in wtt.sheetIndexes.values():
+        size += sum(v.nbytes for v in vars(sheetIdx).values() if hasattr(v, "nbytes"))
+        if sheetIdx.cells is not None:
+            size += int(sheetIdx.cells.memory_usage(deep=True).sum())
+    return size
+
+def report(fpWtt, fpSummary):
+    tracemalloc.start()
+    start = time.time()
+    with open(fpWtt, "rb") as f1, open(fpSummary, "rb") as f2:
+        parser = tt.TimeTableParser.fromFileObjects(f1, f2, useCache=False)
+    wtt = parser.wtt
+    parsed, _ = tracemalloc.get_traced_memory()
+    indexParsed = sheetIndexBytes(wtt)
+    wtt.generateRakeCycles()
+    generated, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    services = wtt.upServices + wtt.downServices
+    events = [e for sv in services for e in sv.events]
+    svcBytes = sum(objBytes(sv) for sv in services)
+    evBytes = sum(objBytes(e) for e in events)
+    table = wtt.eventTable
+    tableBytes = sum(v.nbytes for v in vars(table).values() if hasattr(v, "nbytes"))
+    tableBytes += sys.getsizeof(table.events) # row -> StationEvent references
+
+    print(f"parse + generate: {time.time() - start:.2f}s")
+    print(f"services: {len(services)}, events: {len(events)}")
+    print(f"Service objects:      {svcBytes / max(len(services), 1):8.0f} B/service")
+    print(f"StationEvent objects: {evBytes / max(len(events), 1):8.0f} B/event")
+    # the table is kept alongside the objects, its cost adds to theirs
+    print(f"EventTable columns:   {tableBytes / max(len(table), 1):8.0f} B/event, on top of the objects")
+    print(f"events in total:      {(evBytes + tableBytes) / max(len(events), 1):8.0f} B/event")
+    print(f"sheet indexes held after parse: {indexParsed / 2**20:.1f} MiB, after generate: {sheetIndexBytes(wtt) / 2**20:.1f} MiB")
+    print(f"traced after parse: {parsed / 2**20:.1f} MiB, after generate: {generated / 2**20:.1f} MiB, peak: {peak / 2**20:.1f} MiB")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: memreport.py <wtt.xlsx> <summary.xlsx>")
+    report(sys.argv[1], sys.argv[2])
@@ -1,19 +1,24 @@
 import timetable as tt
 import dash
+import os
 import pandas as pd
-from dash import Dash, html, dcc, Input, Output, State, callback_context
+import numpy as np
+from dash import Dash, html, dcc, Input, Output, State, Patch, callback_context, no_update
 import dash_bootstrap_components as dbc
 import io
 import base64
 import plotly.graph_objs as go
 import copy
+import hashlib
 from datetime import datetime
 from dataclasses import dataclass, field
 from typing import List, Optional, Tuple
 from timetable import Direction
 import time
 import utils
+from wttstats import TimeTableStats
 
+from collections import OrderedDict
 from enum import Enum
 
 class FilterType(Enum):
@@ -32,6 +37,101 @@ class FilterQuery:
     inTimePeriod: Optional[Tuple[int, int]] = (165, 1605) # e.g. (5, 12)
     ac: Optional[bool] = None  # true, false
 
+    def key(self):
+        '''Hashable, normalized form of the query: queries that filter
+        the same way have the same key.'''
+        return (
+            self.type,
+            self.startStation or None,
+            self.endStation or None,
+            tuple(sorted({st.upper() for st in self.passingThrough or []})), # order does not matter
+            tuple(sorted(set(self.inDirection))) if self.inDirection else None, # checklist values, order does not matter
+            tuple(self.inTimePeriod) if self.inTimePeriod else None,
+            self.ac or "all",
+        )
+
+@dataclass
+class FigureEntry:
+    figure: go.Figure # never modified once cached
+    status: object # summary shown next to it
+    links: list = field(default_factory=list) # per trace: rake link index of each point, None in gaps
+
+
+class FigureCache:
+    '''Least-recently-used cache of built figures, bounded by entry count.'''
+    def __init__(self, maxEntries=None):
+        if maxEntries is None:
+            maxEntries = int(os.environ.get("WTT_FIGURE_CACHE_SIZE", 16))
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxEntries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class ViewMode(Enum):
+    SCENE_3D = '3d' # one Scatter3d per link, stacked along z
+    MAREY_2D = '2d' # time-distance chart, Scattergl
+
+
+class LinkSeries:
+    '''Points of one plotted rake link (or service, in SERVICE mode).
+    link: index of the rake link in wtt.rakecycles, label: prefix of the hover text.'''
+    __slots__ = ("name", "link", "label", "isAC", "x", "y", "z", "hover")
+
+    def __init__(self, name, link, label, isAC):
+        self.name = name
+        self.link = link
+        self.label = label
+        self.isAC = isAC
+        self.z = 0 # depth in the 3D scene
+        self.x = []
+        self.y = []
+        self.hover = [] # "STATION @ HH:MM", from EventTable.hoverLabels
+
+    def add(self, minutes, distance, hover):
+        self.x.append(minutes)
+        self.y.append(distance)
+        self.hover.append(hover)
+
+
+def packSeries(series):
+    '''Concatenate series into single x/y/z/hover/link lists with None between
+    them, so plotly draws them as separate polylines of one trace. A point's
+    hover is its full label, "<series label>: STATION @ HH:MM".'''
+    x, y, z, hover, links = [], [], [], [], []
+    for ls in series:
+        if x:
+            x.append(None); y.append(None); z.append(None); hover.append(None); links.append(None)
+        x += ls.x
+        y += ls.y
+        z += [ls.z] * len(ls.x)
+        hover += [f"{ls.label}: {h}" for h in ls.hover]
+        links += [ls.link] * len(ls.x)
+    return x, y, z, hover, links
+
+
+# hover box of a point: its label is the point's customdata; the rake link
+# indexes stay on the server (FigureEntry.links)
+HOVER_TEMPLATE = "%{customdata}<extra></extra>"
+
+
+# (isAC, trace name, colour) of the batched traces
+COLOUR_CLASSES = [(False, "Non-AC", "rgba(90,90,90,0.8)"), (True, "AC", "rgba(66,133,244,0.8)")]
+
+
 class Simulator:
     def __init__(self):
         self.app = Dash(external_stylesheets=[dbc.themes.BOOTSTRAP])
@@ -46,12 +146,18 @@ class Simulator:
 
         self.query = FilterQuery()
         self.query.type = FilterType.RAKELINK
+        self.viewMode = ViewMode.SCENE_3D
+
+        self.figureCache = FigureCache()
+        self.figureVersion = 0 # bumped when the timetable is changed in place, part of figureKey
     
     def drawLayout(self):
             return html.Div(
                 [
                     # Hidden store (optional)
                     dcc.Store(id="app-state"),
+                    # figureKey of the figure in the graph and whether a link is isolated in it
+                    dcc.Store(id="shown-figure"),
 
                     # === LEFT SIDEBAR ===
                     html.Div(
@@ -174,6 +280,19 @@ class Simulator:
                                     style={"marginTop": "8px", "marginBottom": "8px", "padding": "0px 35px"}
                                 ),
 
+                                dbc.RadioItems(
+                                    id="view-selector",
+                                    options=[
+                                        {"label": "3D", "value": ViewMode.SCENE_3D.value},
+                                        {"label": "2D (Marey)", "value": ViewMode.MAREY_2D.value},
+                                    ],
+                                    value=ViewMode.SCENE_3D.value,
+                                    inline=True,
+                                    inputStyle={"marginRight": "6px"},
+                                    labelStyle={"marginRight": "12px", "fontSize": "13px"},
+                                    style={"marginBottom": "8px", "padding": "0px 35px"}
+                                ),
+
                                 # --- TABBED FILTERS ---
                                 html.Div(id="filter-overlay", style={"display": "none"}), 
                                 dbc.Tabs(
@@ -659,64 +778,53 @@ class Simulator:
             Output('start-station_service', 'options'),
             Output('end-station_service', 'options'),
             Output('intermediate-stations_service', 'options')],  
-            Input('upload-wtt-inline', 'contents')
+            [Input('upload-wtt-inline', 'contents'),
+            Input('upload-summary-inline', 'contents')]
         )
-        def initFilters(wttContents):
+        def initParser(wttContents, summaryContents):
+            '''Create or refresh the parser for the uploaded workbooks and fill the
+            station filters. One callback does both, so a WTT upload can never
+            replace the parser while the summary stage is refreshing it.'''
             if not wttContents:
-                return None,[],[],[],[],[],[] # should never reach here
-            
-            wttDecoded = base64.b64decode(wttContents.split(',')[1])
-            wttIO = io.BytesIO(wttDecoded)
+                return None,[],[],[],[],[],[] # no WTT uploaded yet
 
-            if not self.parser:
-                self.parser = tt.TimeTableParser()
+            try:
+                wttDecoded = base64.b64decode(wttContents.split(',')[1])
+                summaryDecoded = base64.b64decode(summaryContents.split(',')[1]) if summaryContents else None
 
-            # register stations
-            self.parser.xlsxToDfFromFileObj(wttIO)
-            self.parser.registerStations()
+                # kept if it already holds these workbooks, else looked up in the
+                # parse cache by hash; only the stages whose workbook changed are
+                # redone, a new summary alone skips the WTT parse
+                self.parser = tt.TimeTableParser.fromWorkbooks(wttDecoded, summaryDecoded, self.parser)
+                self.linkTimingsCreated = self.parser.wtt.rakeCyclesGenerated
+
+            except Exception as e:
+                print(f"Error initializing backend: {e}")
+                return no_update, no_update, no_update, no_update, no_update, no_update, no_update
 
             stations = [s for s in self.parser.wtt.stations]
             options = [{"label": s, "value": s} for s in stations]
 
             return {"initialized": True}, options, options, options, options, options, options
 
-
-        @self.app.callback(
-            [Input('upload-wtt-inline', 'contents'),
-            Input('upload-summary-inline', 'contents')],
-            prevent_initial_call=True
-        )
-        def initBackend(wttContents, summaryContents):
-            if wttContents is None and summaryContents is None:
-                return
-            
-            try:
-                summaryDecoded = base64.b64decode(summaryContents.split(',')[1])
-                summaryIO = io.BytesIO(summaryDecoded)
-                
-                self.parser.registerServices()
-                self.parser.parseWttSummaryFromFileObj(summaryIO)
-                self.parser.wtt.suburbanServices = self.parser.isolateSuburbanServices()
-            
-            except Exception as e:
-                print(f"Error initializing backend: {e}")
-                return 
-
     def _initButtonCallbacks(self):        
         @self.app.callback(
             Output('status-div', 'children'),
             Output('rake-3d-graph', 'figure'),
             Output('export-button', 'disabled'),
+            Output('shown-figure', 'data'),
             Input('generate-button', 'n_clicks'),
             Input('rake-3d-graph', 'clickData'),
             Input('ac-selector', 'value'),
+            Input('view-selector', 'value'),
             State('upload-wtt-inline', 'contents'),
             State('upload-summary-inline', 'contents'),
+            State('shown-figure', 'data'),
             prevent_initial_call=True
         )
-        def onGenerateClick(n_clicks, clickData, ac_status, wttContents, summaryContents):
+        def onGenerateClick(n_clicks, clickData, ac_status, view_mode, wttContents, summaryContents, shown):
             if n_clicks == 0 or wttContents is None or summaryContents is None:
-                return "", go.Figure(), True
+                return "", go.Figure(), True, None
 
             try:
                 # Show loading message
@@ -727,6 +835,7 @@ class Simulator:
                 
                 # pass in the filters object
                 self.query.ac = ac_status
+                self.viewMode = ViewMode(view_mode)
                 qq = self.query
 
                 print(qq.passingThrough)
@@ -735,33 +844,13 @@ class Simulator:
                     print("first time rc gen")
                     self.parser.wtt.generateRakeCycles()
                     self.linkTimingsCreated = True
+                    self.parser.saveToCache() # now with station events
 
                 # Branch filtering logic based on the active tab
                 # all rakelinks will be created already
-                if qq.type == FilterType.SERVICE:
-                    print("Applying Service Filters")
-                    self.applyServiceFilters(qq) # Use new service filter logic
-                elif qq.type == FilterType.STATION:
-                    print(qq)
-                    self.applyStationFilters(qq)
-                else:
-                    # Default to RakeLink filter
-                    print("Applying Rake Link Filters")
-                    self.applyLinkFilters(qq) # Use existing rake link logic
-
-                # create 3D plot
-                print(f"type: {qq.type}")
-                fig = self.visualizeLinks3D()
+                self.applyFilters(qq)
 
                 if qq.type == FilterType.STATION:
-                    fig.update_layout(
-                        scene_camera=dict(
-                            eye=dict(x=0, y=0, z=1.5)   # 2D Plot
-                        ),
-                        scene=dict(
-                            aspectratio=dict(x=3, y=1.5, z=1.2)
-                        )
-                    )
                     # create a custom query to detect gaps of size k minutes
                     # in the given time period at the given stations
                     k = 5
@@ -769,19 +858,34 @@ class Simulator:
                     t = qq.inTimePeriod
                     # self.detectGaps(k, sts, t)
 
-                    # mixing 
-                    before = utils.corridorMixingMinimal(qq.startStation, qq.endStation, qq.inTimePeriod[0], qq.inTimePeriod[1])
+                    self.reportMixing(qq)
 
-                    for i, rc in enumerate(self.parser.wtt.rakecycles):
-                        for svc in rc.servicePath:
-                            if i < len(self.parser.wtt.rakecycles)/2 + 10:
-                                svc.needsACRake = True
+                # built figures are reused for a query seen before
+                key = self.figureKey(qq)
+                entry = self.figureCache.get(key)
+                if entry is None:
+                    # create 3D / Marey plot
+                    print(f"type: {qq.type}")
+                    fig, links = self.visualize()
 
-                    after = utils.corridorMixingMinimal(qq.startStation, qq.endStation, qq.inTimePeriod[0], qq.inTimePeriod[1])
+                    if qq.type == FilterType.STATION and self.viewMode == ViewMode.SCENE_3D:
+                        fig.update_layout(
+                            scene_camera=dict(
+                                eye=dict(x=0, y=0, z=1.5)   # 2D Plot
+                            ),
+                            scene=dict(
+                                aspectratio=dict(x=3, y=1.5, z=1.2)
+                            )
+                        )
 
-                    print("=== Mixing Report ===")
-                    for b, a in zip(before, after):
-                        print(f"{b['station']}: {b['mixing_score']:.3f} -> {a['mixing_score']:.3f}")
+                    # summary contains
+                    # - # Suburban Services
+                    # - # AC services, Non-AC Services
+                    # - # Rake Links generated, how many conflicting, how many dahanu road (rc.lengthKm = 0)
+                    # - # 3 shortest and 3 longest rake link paths with distance
+                    # in a html gui table
+                    entry = FigureEntry(fig, self.generateSummaryStatus(), links)
+                    self.figureCache.put(key, entry)
 
                 # rake link isolation
                 ctx = callback_context
@@ -796,88 +900,34 @@ class Simulator:
                         print("Reset: empty or invalid clickData")
                         for rc in self.parser.wtt.rakecycles:
                             rc.render = True
-                        fig.update_layout(annotations=[])
-                        return "", fig, False
+                        return ("", *self.showFigure(key, entry, shown))
 
                     # malformed point
                     point = clickData["points"][0]
-                    if not isinstance(point, dict) or "curveNumber" not in point:
+                    rc = self.clickedLink(entry, point)
+                    if rc is None:
                         print("Reset: malformed point ", clickData)
-                        for rc in self.parser.wtt.rakecycles:
-                            rc.render = True
-                        fig.update_layout(annotations=[])
-                        return "", fig, False
-
-                    # valid trace
-                    trace_index = point["curveNumber"]
-                    clicked_link = fig.data[trace_index].name
+                        for r in self.parser.wtt.rakecycles:
+                            r.render = True
+                        return ("", *self.showFigure(key, entry, shown))
 
-                    print("Clicked Rake Link:", clicked_link)
+                    print("Clicked Rake Link:", rc.linkName)
 
                     # isolate selected rake link
-                    for rc in self.parser.wtt.rakecycles:
-                        rc.render = (rc.linkName == clicked_link)
-
-                    # fade/highlight
-                    for trace in fig.data:
-                        if trace.name != clicked_link:
-                            trace.opacity = 0.05
-                            trace.line.width = 2 if hasattr(trace, "line") else None
-                            trace.marker.size = 1.5 if hasattr(trace, "marker") else None
-                        else:
-                            trace.opacity = 1.0
-                            trace.line.width = 4 if hasattr(trace, "line") else None
-                            trace.marker.size = 3 if hasattr(trace, "marker") else None
-
-                    # annotation summary
-                    rc = next(r for r in self.parser.wtt.rakecycles if r.linkName == clicked_link)
-
-                    annot_text = (
-                        f"<b>Rake Link {rc.linkName}</b><br>"
-                        f"Services: {len(rc.servicePath)}<br>"
-                        f"Start: {rc.servicePath[0].initStation.name}<br>"
-                        f"End: {rc.servicePath[-1].finalStation.name}<br>"
-                        f"Distance: {int(rc.lengthKm)} km<br>"
-                        f"Rake: {'AC' if rc.rake.isAC else 'Non-AC'} ({rc.rake.rakeSize}-car)<br>"
-                        # f"<span style='font-size:11px;color:#eee'>Click empty space to reset</span>"
-                    )
-
-                    fig.update_layout(
-                        annotations=[
-                            dict(
-                                x=0.02, y=0.97,
-                                xref="paper", yref="paper",
-                                showarrow=False,
-                                align="left",
-                                bgcolor="rgba(0,0,0,0.75)",
-                                bordercolor="rgba(255,255,255,0.9)",
-                                borderwidth=2,
-                                borderpad=8,
-                                font=dict(size=14, color="white"),
-                                text=annot_text
-                            )
-                        ]
-                    )
+                    for r in self.parser.wtt.rakecycles:
+                        r.render = (r.linkName == rc.linkName)
 
                     # return early (no summary when isolatinf)
-                    return "", fig, False
-
-                # summary contains
-                # - # Suburban Services
-                # - # AC services, Non-AC Services
-                # - # Rake Links generated, how many conflicting, how many dahanu road (rc.lengthKm = 0)
-                # - # 3 shortest and 3 longest rake link paths with distance
-                # in a html gui table
-                status = self.generateSummaryStatus()
+                    return ("", *self.isolateFigure(key, entry, rc, shown))
 
-                return status, fig, False
+                return (entry.status, *self.showFigure(key, entry, shown))
 
             except Exception as e:
                 error_msg = html.Div([
                     html.Div("✗ Error", style={"color": "#ef4444", "fontWeight": "600", "fontSize": "16px"}),
                     html.Div(str(e), style={"fontSize": "12px", "color": "#64748b", "marginTop": "8px", "fontFamily": "monospace"})
                 ])
-                return error_msg, go.Figure(), True
+                return error_msg, go.Figure(), True, None
 
     
         @self.app.callback(
@@ -896,37 +946,95 @@ class Simulator:
             
             return dict(content=report_content, filename=filename)
         
+    def clickedLink(self, entry, point):
+        '''RakeCycle of a clicked point of the cached figure entry, looked up by
+        the point's trace and position in entry.links.'''
+        if not isinstance(point, dict):
+            return None
+        curve, pos = point.get("curveNumber"), point.get("pointNumber")
+        if not isinstance(curve, int) or not isinstance(pos, int) or not 0 <= curve < len(entry.links):
+            return None
+        links = entry.links[curve]
+        idx = links[pos] if 0 <= pos < len(links) else None
+        rakecycles = self.parser.wtt.rakecycles
+        return rakecycles[idx] if idx is not None and 0 <= idx < len(rakecycles) else None
+
     def detectGaps(self, size, stations, inTime):
         print(f"# Gaps > {size} minutes:")
         t_lower, t_upper = inTime
+        table = self.parser.wtt.eventTable
 
         for stn in stations:
-            events = tt.TimeTableParser.eventsByStationMap.get(stn, [])
-            if not events:
-                print(f"{stn}: 0")
-                continue
+            # already sorted by time
+            times = table.time[table.stationWindow(stn, t_lower, t_upper)]
 
-            # collect only times inside the given range
-            times = [e.atTime for e in events if t_lower <= e.atTime <= t_upper]
+            gapCount = int(np.count_nonzero(np.diff(times) > size))
+            print(f"{stn}: {gapCount}")
 
-            if not times:
-                print(f"{stn}: 0")
-                continue
 
-            times.sort()
+    def applyFilters(self, qq):
+        '''Reset every render flag, then apply the filters of the query's tab.
+        The render state (and so the figure and summary built from it) then
+        depends on the query alone, which the figure cache relies on.'''
+        self.resetRenderFlags()
+        if qq.type == FilterType.SERVICE:
+            print("Applying Service Filters")
+            self.applyServiceFilters(qq) # Use new service filter logic
+        elif qq.type == FilterType.STATION:
+            print(qq)
+            self.applyStationFilters(qq)
+        else:
+            # Default to RakeLink filter
+            print("Applying Rake Link Filters")
+            self.applyLinkFilters(qq) # Use existing rake link logic
 
-            gapCount = 0
-            for i in range(1, len(times)):
-                if (times[i] - times[i-1]) > size:
-                    gapCount += 1
+    def resetRenderFlags(self):
+        '''Make every rake link, service and event renderable again.'''
+        wtt = self.parser.wtt
+        for rc in wtt.rakecycles:
+            rc.render = True
+            for svc in rc.servicePath:
+                svc.render = True
+        for svc in wtt.suburbanServices or []:
+            svc.render = True
+        if wtt.eventTable is not None:
+            wtt.eventTable.render[:] = True
+            wtt.eventTable.syncRender()
 
-            print(f"{stn}: {gapCount}")
+    def reportMixing(self, qq):
+        '''Print the AC mixing scores of the query's corridor before and after
+        making the first half of the rake links AC.'''
+        wtt = self.parser.wtt
+        before = utils.corridorMixingMinimal(wtt, qq.startStation, qq.endStation, qq.inTimePeriod[0], qq.inTimePeriod[1])
+
+        changed = False
+        for i, rc in enumerate(wtt.rakecycles):
+            for svc in rc.servicePath:
+                if i < len(wtt.rakecycles)/2 + 10 and not svc.needsACRake:
+                    svc.needsACRake = True
+                    changed = True
+
+        after = utils.corridorMixingMinimal(wtt, qq.startStation, qq.endStation, qq.inTimePeriod[0], qq.inTimePeriod[1])
+
+        print("=== Mixing Report ===")
+        for b, a in zip(before, after):
+            print(f"{b['station']}: {b['mixing_score']:.3f} -> {a['mixing_score']:.3f}")
 
+        if changed:
+            # AC requirements were changed in place, cached figures and summaries are stale;
+            # a new version also changes the key, so the figure the browser shows is replaced
+            self.figureCache.clear()
+            self.figureVersion += 1
 
     def applyStationFilters(self, qq):
         t_lower, t_upper = qq.inTimePeriod
         for rc in self.parser.wtt.rakecycles:
             rc.render = True
+
+        # event render flags: only events inside the time window
+        table = self.parser.wtt.eventTable
+        table.render[:] = table.inWindow(t_lower, t_upper)
+        table.syncRender()
     
         for svc in self.parser.wtt.suburbanServices:
             svc.render = True
@@ -934,14 +1042,6 @@ class Simulator:
             if not svc.events: # invalid
                 svc.render = False
                 continue
-
-            # Also reset event render flags
-            for ev in svc.events:
-                ev.render = True
-
-                t = ev.atTime
-                if not (t_lower <= t <= t_upper):
-                    ev.render = False
             
             svc.checkACConstraint(qq)
 
@@ -953,12 +1053,21 @@ class Simulator:
         Sets the 'render' flag on each Service object.
         Also updates the parent RakeCycle 'render' flag.
         '''
+        # passing through a station in the window needs
+        # the service to be running in the window at all
+        active = None
+        if qq.passingThrough and qq.inTimePeriod:
+            active = {id(s) for s in self.parser.wtt.servicesActive(*qq.inTimePeriod)}
+
         for svc in self.parser.wtt.suburbanServices:
             svc.render = True
 
             if not svc.events: # invalid
                 svc.render = False
                 continue
+            if active is not None and id(svc) not in active:
+                svc.render = False
+                continue
             # Also reset event render flags
             for ev in svc.events:
                 ev.render = True
@@ -1000,6 +1109,11 @@ class Simulator:
             else:
                 buffer.write("  No inconsistencies found.\n")
 
+            if self.parser.wtt.chainDiagnostics:
+                buffer.write("\n=== WTT Link Diagnostics ===\n")
+                for diag in self.parser.wtt.chainDiagnostics:
+                    buffer.write(f"  {diag}\n")
+
 
             if self.query.type == FilterType.RAKELINK:
                 # List rakecycles plotted
@@ -1142,36 +1256,26 @@ class Simulator:
         wtt = self.parser.wtt
 
         # compute stats
-        rcs = [rc for rc in wtt.rakecycles if rc.render]
+        stats = TimeTableStats(wtt)
 
-        # total services
-        total_services=0
-        ac_services=0
-        for rc in rcs:
-            total_services += len(rc.servicePath)
-            for svc in rc.servicePath:
-                if svc.needsACRake and svc.render:
-                    ac_services+=1
-                    # print(f"Needs AC: {svc.serviceId}")
-                # else:
-                #     print(f"Non AC: {svc.serviceId}")
+        total_services = stats.renderedLinkServices
+        ac_services = stats.renderedACServices
 
-        total_parsed_services = len(wtt.suburbanServices) 
+        total_parsed_services = stats.suburbanServices
         non_ac_services = total_services - ac_services 
 
         # rake links
-        total_parsed_links = len(wtt.rakecycles)
-        parsing_conflicts = len(wtt.conflictingLinks)
+        total_parsed_links = stats.rakeLinks
+        parsing_conflicts = stats.conflictingLinks
 
-        total_rendered_links = len(rcs)
-        valid_rcs = [rc for rc in rcs if rc.lengthKm > 0]
-        shortest_rcs = sorted(valid_rcs, key=lambda rc:rc.lengthKm)[:3]
-        longest_rcs = sorted(valid_rcs, key=lambda rc: rc.lengthKm, reverse=True)[:3]
+        total_rendered_links = stats.renderedLinks
+        valid_links = [(name, km) for name, km in stats.renderedLinkKm.items() if km > 0]
+        shortest_rcs = sorted(valid_links, key=lambda link: link[1])[:3]
+        longest_rcs = sorted(valid_links, key=lambda link: link[1], reverse=True)[:3]
 
         # contents
-        svcs = [s for s in wtt.suburbanServices if s.render]
         if self.query.type == FilterType.SERVICE:
-            total_services = len(svcs)
+            total_services = stats.renderedServices
             non_ac_services = total_services - ac_services
 
         service_items = [
@@ -1188,9 +1292,9 @@ class Simulator:
         ]
 
         rake_footer = html.Div([
-            html.Small("Shortest: " + ", ".join(f"{rc.linkName} ({rc.lengthKm:.1f} km)" for rc in shortest_rcs)),
+            html.Small("Shortest: " + ", ".join(f"{name} ({km:.1f} km)" for name, km in shortest_rcs)),
             html.Br(),
-            html.Small("Longest: " + ", ".join(f"{rc.linkName} ({rc.lengthKm:.1f} km)" for rc in longest_rcs)),
+            html.Small("Longest: " + ", ".join(f"{name} ({km:.1f} km)" for name, km in longest_rcs)),
         ])
 
         service_card = self.make_summary_card("Service Summary", service_items)
@@ -1246,44 +1350,24 @@ class Simulator:
             return
         
         selected = [s.upper() for s in selected]
-        t_start, t_end = qq.inTimePeriod if qq.inTimePeriod else (None, None)
+        t_start, t_end = qq.inTimePeriod if qq.inTimePeriod else (-np.inf, np.inf)
+        wtt = self.parser.wtt
 
-        for rc in self.parser.wtt.rakecycles:
+        # services with an event at each selected station inside the window
+        passing = [
+            {id(e.ofService) for e in wtt.stationEventsInWindow(st, t_start, t_end)}
+            for st in selected
+        ]
+
+        for rc in wtt.rakecycles:
             rc.render = rc.render and True
             if not rc.servicePath:
                 rc.render = rc.render and False
                 continue
 
-            # flatten all events in this rakecycle
-            el = []
-            for s in rc.servicePath:
-                el.extend(s.events)
-
-            # filter by time
-            if qq.inTimePeriod:
-                filtered = []
-                for e in el:
-                    if not e.atTime:
-                        continue
-
-                    minutes = e.atTime
-
-                    if t_start <= minutes <= t_end:
-                        filtered.append(e)
-                el = filtered  # keep only events inside window
-
-            # station membership check
-            seen = set()
-            for e in el:
-                if not e.atStation:
-                    continue
-                stName = str(e.atStation).strip().upper()
-                if stName in selected:
-                    seen.add(stName)
-                if len(seen) == len(selected):
-                    break
-
-            if len(seen) < len(selected):
+            # every selected station must be passed by some service of the link
+            linkServices = {id(s) for s in rc.servicePath}
+            if not all(linkServices & svcs for svcs in passing):
                 rc.render = False
 
     def applyACFilter(self, qq):
@@ -1313,8 +1397,10 @@ class Simulator:
         visible_count = len([r for r in self.parser.wtt.rakecycles if r.render])
         print(f"Visible rake cycles after filter: {visible_count}")
 
-    def visualizeLinks3D(self):
-        rakecycles = [rc for rc in self.parser.wtt.rakecycles if rc.servicePath]
+    def linkSeries(self):
+        '''The (time, distance) polylines to plot, in plotting order: one per
+        rendered service in SERVICE mode, one per rendered rake link otherwise.'''
+        rakecycles = [(i, rc) for i, rc in enumerate(self.parser.wtt.rakecycles) if rc.servicePath]
         print(f"We have  len {len(rakecycles)}")
         if not rakecycles:
             raise ValueError("No valid rakecycles found.")
@@ -1322,102 +1408,26 @@ class Simulator:
         distanceMap = tt.TimeTableParser.distanceMap
         stationToY = {st.upper(): distanceMap[st.upper()] for st in distanceMap}
 
-        all_traces = []
-        z_labels = []
-        z_offset = 0
-
-        # Check if we're filtering by service (granular) or rake link (coarse)
-        is_service_filter = (self.query.type == FilterType.SERVICE)
-
-        for rc in rakecycles:
+        series = []
+        for rcIdx, rc in rakecycles:
             # --- SERVICE FILTER MODE: Only render filtered services ---
-            if is_service_filter:
-            # Don't check rc.render here - we only care about individual services
+            if self.query.type == FilterType.SERVICE:
+                # Don't check rc.render here - we only care about individual services
                 for svc in rc.servicePath:
                     # Skip services that don't pass the filter
                     if not svc.render:
                         continue
 
-                    # Build points for this single service
-                    # Separate lists for in-range vs out-of-range events
-                    x_in, y_in, z_in, labels_in = [], [], [], []
-                    x_out, y_out, z_out, labels_out = [], [], [], []
-                    
-                    for ev in svc.events:
-                        # if not ev.atTime or not ev.atStation:
-                        #     continue
-
-                        minutes = ev.atTime
-
+                    # Format service IDs for display (handle list of IDs)
+                    svc_id_str = ','.join(str(sid) for sid in svc.serviceId) if svc.serviceId else '?'
+                    ls = LinkSeries(f"{rc.linkName}-{svc_id_str}", rcIdx, svc_id_str, bool(svc.needsACRake))
+                    for ev, minutes, hover in zip(svc.events, *self.eventPlotData(svc)):
                         stName = str(ev.atStation).strip().upper()
                         if stName not in stationToY:
                             continue
-
-                        # # Check if event is within the filtered time range
-                        # ev_render = getattr(ev, 'render', True)
-                        
-                        # if ev_render:
-                        # Event is in the time filter range
-                        x_in.append(minutes)
-                        y_in.append(stationToY[stName])
-                        z_in.append(z_offset)
-                        labels_in.append(stName)
-                        # else:
-                        #     # Event is outside the time filter range
-                        #     x_out.append(minutes)
-                        #     y_out.append(stationToY[stName])
-                        #     z_out.append(z_offset)
-                        #     labels_out.append(stName)
-
-                    # Format service IDs for display (handle list of IDs)
-                    svc_id_str = ','.join(str(sid) for sid in svc.serviceId) if svc.serviceId else '?'
-                    
-                    # Create trace for OUT-OF-RANGE events (dimmed, background context)
-                    if x_out:
-                        color_dim = "rgba(66,133,244,0.6)" if svc.needsACRake else "rgba(90,90,90,0.6)"
-                        
-                        all_traces.append(
-                            go.Scatter3d(
-                                x=x_out, y=y_out, z=z_out,
-                                mode="lines+markers",
-                                line=dict(color=color_dim),
-                                marker=dict(size=2, color=color_dim),
-                                hovertext=[
-                                    f"{svc_id_str}: {st} @ {(int(xx)//60) % 24:02d}:{int(xx%60):02d} (outside filter)"
-                                    for xx, st in zip(x_out, labels_out)
-                                ],
-                                hoverinfo="text",
-                                name=f"{rc.linkName}-{svc_id_str} (context)",
-                                showlegend=False,  # Don't clutter legend with dimmed traces
-                                visible=True,
-                            )
-                        )
-                    
-                    # Create trace for IN-RANGE events (prominent, filtered results)
-                    # color = "rgba(66,133,244,0.8)" if svc.needsACRake else "rgba(90,90,90,0.8)"
-                    if x_in:
-                        color_bright = "rgba(66,133,244,0.8)" if svc.needsACRake else "rgba(90,90,90,0.8)"
-                        
-                        all_traces.append(
-                            go.Scatter3d(
-                                x=x_in, y=y_in, z=z_in,
-                                mode="lines+markers",
-                                line=dict(color=color_bright),
-                                marker=dict(size=2, color=color_bright),  # Larger markers
-                                hovertext=[
-                                    f"{svc_id_str}: {st} @ {(int(xx)//60) % 24:02d}:{int(xx%60):02d}"
-                                    for xx, st in zip(x_in, labels_in)
-                                ],
-                                hoverinfo="text",
-                                name=f"{rc.linkName}-{svc_id_str}",
-                                visible=True,
-                            )
-                        )
-                        z_labels.append((z_offset, f"{rc.linkName}-{svc_id_str}"))
-                    
-                    # Only increment z if we rendered something
-                    if x_in or x_out:
-                        z_offset += 40  # increment z for next service
+                        ls.add(minutes, stationToY[stName], hover)
+                    if ls.x:
+                        series.append(ls)
 
             # RAKELINK mode
             else:
@@ -1425,67 +1435,261 @@ class Simulator:
                 if not rc.render:
                     continue
 
-                if self.query.type == FilterType.STATION:
-                    mode = "markers"
-                elif self.query.type ==FilterType.RAKELINK:
-                    mode = "lines+markers"
-                
-                # Aggregate all services in the rake cycle into a single trace
-                x, y, z, stationLabels = [], [], [], []
-
+                # Aggregate all services in the rake cycle into a single series
+                ls = LinkSeries(rc.linkName, rcIdx, rc.linkName, bool(rc.rake.isAC))
                 for svc in rc.servicePath:
                     if not svc.render:
                         continue
                     # In rake link mode, we render all services in a visible rake cycle
-                    for ev in svc.events:
+                    for ev, minutes, hover in zip(svc.events, *self.eventPlotData(svc)):
                         if not ev.atTime or not ev.atStation:
                             continue
-
                         if not ev.render:
                             continue
-                            
-                        minutes = ev.atTime
-                        # print(minutes)
 
                         stName = str(ev.atStation).strip().upper()
                         if stName not in stationToY:
                             continue
-
-                        x.append(minutes)
-                        y.append(stationToY[stName])
-                        z.append(z_offset)
-                        stationLabels.append(stName)
-                
-                # Create single trace for entire rake cycle
-                if x:
-                    color = "rgba(66,133,244,0.8)" if rc.rake.isAC else "rgba(90,90,90,0.8)"
-                    
-                    all_traces.append(
-                        go.Scatter3d(
-                            x=x, y=y, z=z,
-                            mode=mode,
-                            line=dict(color=color),
-                            marker=dict(size=2, color=color),
-                            # customdata=[{"link": rc.linkName} for _ in x],
-                            hovertext=[
-                                f"{rc.linkName}: {st} @ {(int(xx)//60) % 24:02d}:{int(xx%60):02d}"
-                                for xx, st in zip(x, stationLabels)
-                            ],
-
-                            hoverinfo="text",
-                            name=rc.linkName,
-                            visible=True,
-                        )
-                    )
-                    z_labels.append((z_offset, rc.linkName))
-                    z_offset += 40  # increment z for next rakecycle
-        
+                        ls.add(minutes, stationToY[stName], hover)
+                if ls.x:
+                    series.append(ls)
+
+        return series, stationToY
+
+    def eventPlotData(self, svc):
+        '''(x values, hover labels) of svc's events, built once in the EventTable
+        when the rake cycles were generated.'''
+        data = self.parser.wtt.eventTable.plotData(svc)
+        if data is None:
+            # not in the table, format them here
+            data = ([e.atTime for e in svc.events],
+                    [f"{str(e.atStation).strip().upper()} @ {(int(e.atTime)//60) % 24:02d}:{int(e.atTime%60):02d}"
+                     if e.atTime is not None else f"{str(e.atStation).strip().upper()} @ ?"
+                     for e in svc.events])
+        return data
+
+    def traceMode(self):
+        return "markers" if self.query.type == FilterType.STATION else "lines+markers"
+
+    def timeAxisRange(self):
         if self.query.inTimePeriod and (self.query.type == FilterType.SERVICE or 
                                         self.query.type == FilterType.STATION):
             x_start, x_end = self.query.inTimePeriod
             x_end += 90 # padding
         else:
             x_start, x_end  = 165, 1605
+        return x_start, x_end
+
+    def visualize(self):
+        '''(figure, rake link index of each point of each trace) of the view mode.'''
+        if self.viewMode == ViewMode.MAREY_2D:
+            return self.visualizeLinks2D()
+        return self.visualizeLinks3D()
+
+    def visualizeLinks2D(self):
+        '''Time-distance (Marey) chart. All series of a colour class are packed
+        into one Scattergl trace, separated by None gaps; every point carries its
+        hover label as customdata. Returns (figure, rake link index of each point
+        of each trace).'''
+        series, stationToY = self.linkSeries()
+
+        all_traces, traceLinks = [], []
+        for isAC, name, color in COLOUR_CLASSES:
+            x, y, _, hover, links = packSeries([ls for ls in series if ls.isAC == isAC])
+            if not x:
+                continue
+            traceLinks.append(links)
+            all_traces.append(
+                go.Scattergl(
+                    x=x, y=y,
+                    mode=self.traceMode(),
+                    line=dict(color=color, width=1.5),
+                    marker=dict(size=3, color=color),
+                    customdata=hover,
+                    hovertemplate=HOVER_TEMPLATE,
+                    name=name,
+                )
+            )
+
+        x_start, x_end = self.timeAxisRange()
+        tickPositions = list(range(x_start, x_end + 1, 60))
+        tickLabels = [f"{(t // 60) % 24:02d}:{int(t % 60):02d}" for t in tickPositions]
+
+        fig = go.Figure(data=all_traces)
+        fig.update_layout(
+            font=dict(size=12, color="#CCCCCC"),
+            xaxis=dict(
+                showgrid=True,
+                title="Time of Day →",
+                range=[x_start, x_end],
+                tickvals=tickPositions,
+                ticktext=tickLabels,
+            ),
+            yaxis=dict(
+                showgrid=True,
+                tickvals=list(stationToY.values()),
+                ticktext=list(stationToY.keys()),
+                range=[min(stationToY.values()), max(stationToY.values())],
+            ),
+            hovermode="closest",
+            uirevision="marey", # keep zoom/pan across updates
+            height=700,
+            margin=dict(t=10, l=5, b=5, r=5),
+            autosize=True
+        )
+        return fig, traceLinks
+
+    def figureKey(self, qq):
+        '''Figure cache key: timetable version (hash of the uploaded workbooks
+        and the count of in-place changes), view mode and the normalized query,
+        hashed into a short string that is also kept in the browser
+        (shown-figure store).'''
+        key = (self.parser.cacheKey, self.figureVersion, self.viewMode, qq.key())
+        return hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+
+    def showFigure(self, key, entry, shown):
+        '''(figure, shown-figure data) to show the cached entry. Nothing is sent
+        if the browser already shows it; an isolated link is undone with a Patch.'''
+        if not shown or shown.get("key") != key:
+            return entry.figure, False, {"key": key, "isolated": False, "highlight": False}
+        if not shown.get("isolated"):
+            return no_update, False, no_update
+
+        patch = Patch()
+        for i in range(len(entry.figure.data)):
+            patch["data"][i]["opacity"] = None
+        if shown.get("highlight"):
+            del patch["data"][len(entry.figure.data)]
+        patch["layout"]["annotations"] = []
+        return patch, False, {"key": key, "isolated": False, "highlight": False}
+
+    def isolateFigure(self, key, entry, rc, shown):
+        '''(figure, shown-figure data) with rake link rc isolated. If the browser
+        already shows the cached figure, only what changes is sent as a Patch;
+        the cached figure is never modified, a figure not shown yet is isolated
+        on a copy.'''
+        faded = 0.05 if self.viewMode == ViewMode.SCENE_3D else 0.1
+        highlight = self.highlightTrace(entry, rc)
+        annotations = [self.linkAnnotation(rc)]
+        state = {"key": key, "isolated": True, "highlight": highlight is not None}
+
+        if not shown or shown.get("key") != key:
+            fig = go.Figure(entry.figure)
+            for trace in fig.data:
+                trace.opacity = faded
+            if highlight is not None:
+                fig.add_trace(highlight)
+            fig.update_layout(annotations=annotations)
+            return fig, False, state
+
+        patch = Patch()
+        nBase = len(entry.figure.data)
+        if not shown.get("isolated"):
+            for i in range(nBase):
+                patch["data"][i]["opacity"] = faded
+        if highlight is not None:
+            highlight = highlight.to_plotly_json()
+            if shown.get("highlight"):
+                patch["data"][nBase] = highlight # replace the previous highlight
+            else:
+                patch["data"].append(highlight)
+        elif shown.get("highlight"):
+            del patch["data"][nBase]
+        patch["layout"]["annotations"] = annotations
+        return patch, False, state
+
+    def highlightTrace(self, entry, rc):
+        '''Trace of the points of rake link rc, picked out of the batched traces
+        of the cached figure by entry.links. None if the link is not plotted.'''
+        is3D = self.viewMode == ViewMode.SCENE_3D
+        rcIdx = self.parser.wtt.rakecycles.index(rc)
+        x, y, z = [], [], []
+        for trace, links in zip(entry.figure.data, entry.links):
+            prev = None
+            for i, link in enumerate(links):
+                if link != rcIdx:
+                    continue
+                if prev is not None and i != prev + 1 and x:
+                    x.append(None); y.append(None); z.append(None)
+                x.append(trace.x[i]); y.append(trace.y[i])
+                z.append(trace.z[i] if is3D else None)
+                prev = i
+        if not x:
+            return None
+
+        # hover and clicks go to the batched point underneath, so the
+        # highlight carries no customdata of its own
+        color = "rgba(66,133,244,1.0)" if rc.rake.isAC else "rgba(90,90,90,1.0)"
+        common = dict(
+            x=x, y=y,
+            mode=self.traceMode(),
+            hoverinfo="skip",
+            name=rc.linkName,
+        )
+        if is3D:
+            return go.Scatter3d(z=z, line=dict(color=color, width=4), marker=dict(size=3, color=color), **common)
+        return go.Scattergl(line=dict(color=color, width=3), marker=dict(size=5, color=color), **common)
+
+    def linkAnnotation(self, rc):
+        '''Summary box of an isolated rake link.'''
+        annot_text = (
+            f"<b>Rake Link {rc.linkName}</b><br>"
+            f"Services: {len(rc.servicePath)}<br>"
+            f"Start: {rc.servicePath[0].initStation.name}<br>"
+            f"End: {rc.servicePath[-1].finalStation.name}<br>"
+            f"Distance: {int(rc.lengthKm)} km<br>"
+            f"Rake: {'AC' if rc.rake.isAC else 'Non-AC'} ({rc.rake.rakeSize}-car)<br>"
+            # f"<span style='font-size:11px;color:#eee'>Click empty space to reset</span>"
+        )
+        return dict(
+            x=0.02, y=0.97,
+            xref="paper", yref="paper",
+            showarrow=False,
+            align="left",
+            bgcolor="rgba(0,0,0,0.75)",
+            bordercolor="rgba(255,255,255,0.9)",
+            borderwidth=2,
+            borderpad=8,
+            font=dict(size=14, color="white"),
+            text=annot_text
+        )
+
+    def visualizeLinks3D(self):
+        '''3D scene, links stacked along z; traces as in visualizeLinks2D.'''
+        series, stationToY = self.linkSeries()
+
+        all_traces, traceLinks = [], []
+        z_labels = []
+        z_offset = 0
+
+        # Check if we're filtering by service (granular) or rake link (coarse)
+        is_service_filter = (self.query.type == FilterType.SERVICE)
+
+        for ls in series:
+            ls.z = z_offset
+            z_labels.append((z_offset, ls.name))
+            z_offset += 40  # increment z for next service / rakecycle
+
+        # one trace per colour class, links separated by None gaps
+        for isAC, name, color in COLOUR_CLASSES:
+            x, y, z, hover, links = packSeries([ls for ls in series if ls.isAC == isAC])
+            if not x:
+                continue
+            traceLinks.append(links)
+            all_traces.append(
+                go.Scatter3d(
+                    x=x, y=y, z=z,
+                    mode=self.traceMode(),
+                    line=dict(color=color),
+                    marker=dict(size=2, color=color),
+                    customdata=hover,
+                    hovertemplate=HOVER_TEMPLATE,
+                    name=name,
+                    visible=True,
+                )
+            )
+
+        x_start, x_end = self.timeAxisRange()
         # padding = 120  # 120 minutes
         # x_end = (x_end + padding)
         # x_start = max(0, x_start - padding)
@@ -1540,7 +1744,7 @@ class Simulator:
             autosize=True
         )
 
-        return fig
+        return fig, traceLinks
 
     def run(self):
         self.app.run(debug=True, port=8051)
@@ -7,11 +7,20 @@
 # We want to plot the entire journey in a single day, and in particular, 
 # during the peak hour
 import pandas as pd
+from pandas.io.parsers import TextParser
+import numpy as np
+import openpyxl
 import re
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import logging
-from datetime import datetime
+from datetime import datetime, time as dtime
 import time
+import io
+import os
+
+from wttcache import ParseCache
+from wttstats import TimeTableStats
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -29,10 +38,16 @@ logger = logging.getLogger(__name__)
 
 SERVICE_ID_LEN = 5
 
+# WTT sheet layout
+WTT_SKIP_ROWS = 4 # rows above the station header row
+UP_TT_COLUMNS = 949 # with uniform row indexing, last = 91024
+DOWN_TT_COLUMNS = 982 # with uniform row indexing, last = 91055
+
 class TimeTable:
     def __init__(self):
         # ground truth
-        self.xlsxSheets = []
+        self.xlsxSheets = [] # upsheet, downsheet
+        self.sheetIndexes = {} # Direction: SheetIndex of the up/down sheet, see sheetIndex
         # self.stationCol = None
 
         self.rakes = [Rake(i) for i in range(1,100)] # each rake has an id 1-100
@@ -51,6 +66,68 @@ class TimeTable:
         self.rakecycles = [] # needs timing info
         self.allCyclesWtt = [] # from wtt linked follow
         self.conflictingLinks = []
+        self.chainDiagnostics = [] # ChainDiagnostic, from makeRakeCyclePathsSV
+        self.rakeCyclesGenerated = False # set by generateRakeCycles
+        self.eventTable = None # EventTable over every generated event
+        self.spanIndex = None # SpanIndex over the eventTable's service spans
+        self.serviceIndex = {} # serviceKey(sid): <Service>, see indexServices
+        self.suburbanIndex = {} # serviceKey(first sid): suburban <Service>, see generateRakeCycles
+        self.chainHeads = {} # serviceKey(first sid): path in allCyclesWtt
+        self.linkedFrom = defaultdict(list) # serviceKey(sid): [services linkedTo sid]
+
+    def __getstate__(self):
+        # the sheet indexes are several copies of xlsxSheets,
+        # cached timetables rebuild them on demand
+        state = self.__dict__.copy()
+        state["sheetIndexes"] = {}
+        return state
+
+    def sheetIndex(self, direction):
+        '''SheetIndex of the up/down sheet, built from xlsxSheets on first use.'''
+        sheetIdx = self.sheetIndexes.get(direction)
+        if sheetIdx is None:
+            sheet = self.xlsxSheets[0 if direction == Direction.UP else 1]
+            sheetIdx = self.sheetIndexes[direction] = SheetIndex(sheet, self.stations)
+        return sheetIdx
+
+    def resetRakeCycles(self):
+        '''Forget everything derived from the Link Summary, keeping the
+        registered services (and any station events they already have).'''
+        self.suburbanServices = None
+        self.rakecycles = []
+        self.allCyclesWtt = []
+        self.conflictingLinks = []
+        self.chainDiagnostics = []
+        self.chainHeads = {}
+        self.linkedFrom = defaultdict(list)
+        self.suburbanIndex = {}
+        self.eventTable = None
+        self.spanIndex = None
+        self.rakeCyclesGenerated = False
+
+    def servicesActive(self, t_lower, t_upper):
+        '''Generated services whose first-to-last event span overlaps [t_lower, t_upper].'''
+        services = self.eventTable.services
+        return [services[i] for i in self.spanIndex.overlapping(t_lower, t_upper)]
+
+    def stationEventsInWindow(self, stName, t_lower, t_upper):
+        '''StationEvents at stName with t_lower <= atTime <= t_upper, sorted by time.'''
+        events = self.eventTable.events
+        return [events[row] for row in self.eventTable.stationWindow(stName, t_lower, t_upper)]
+
+    def indexServices(self):
+        '''(Re)build the serviceId -> Service index over the up and down services,
+        used to match Link Summary ids. Every id of a multi-ID service is indexed;
+        on a repeated id the first service (in sheet order) wins, as the summary
+        parse always matched them. fixPath uses suburbanIndex instead.'''
+        self.serviceIndex = {}
+        for sv in self.upServices + self.downServices:
+            for sid in sv.serviceId:
+                self.serviceIndex.setdefault(serviceKey(sid), sv)
+
+    def getService(self, sid):
+        '''Service with id sid (int, "93232" or "ETY 1"), or None.'''
+        return self.serviceIndex.get(serviceKey(sid))
 
     
     # def generateRakeCyclePath(self, rakecycle):
@@ -68,11 +145,14 @@ class TimeTable:
     # - No cycles in CCs
     def makeRakeCyclePathsSV(self, services):
         '''
-        Build rake-cycle paths by recursively following directed `linkedTo` chains.
+        Build rake-cycle paths by following directed `linkedTo` chains.
         Each service node stores both `prev` and `next` links.
+        Cycles and forks in the linkedTo graph are recorded in self.chainDiagnostics.
         '''
         idMap = {sid: s for s in services for sid in s.serviceId}
         adj = defaultdict(lambda: {'prev': None, 'next': None})
+        preds = defaultdict(list) # every sid linked to a sid, to report forks
+        self.chainDiagnostics = []
 
         # build directed links
         # ensure every linked node knows its prev and next
@@ -88,10 +168,7 @@ class TimeTable:
             # of 2 or more services.)
             if not sv.linkedTo: 
                 continue
-            try:
-                nextId = int(str(sv.linkedTo).strip())
-            except ValueError:
-                nextId = str(sv.linkedTo).strip()
+            nextId = serviceKey(sv.linkedTo)
 
             # if this service is linked to 
             # a non-suburban service, we do
@@ -110,17 +187,23 @@ class TimeTable:
             # is stored in the adjacency list.
             adj[sid]['next'] = nextId  
             adj[nextId]['prev'] = sid
+            if sid not in preds[nextId]:
+                preds[nextId].append(sid)
+
+        # a service linked from two predecessors, only
+        # one of them can continue into it
+        for sid, prevs in preds.items():
+            if len(prevs) > 1:
+                self.chainDiagnostics.append(ChainDiagnostic(ChainIssue.FORK, prevs + [sid]))
 
         visited = set()
 
         def followChain(sid, chain):
-            if sid in visited or sid not in idMap:
-                return
-            visited.add(sid)
-            chain.append(idMap[sid])
-            nxt = adj[sid]['next']
-            if nxt:
-                followChain(nxt, chain)
+            # iterative, rake links can be long
+            while sid and sid not in visited and sid in idMap:
+                visited.add(sid)
+                chain.append(idMap[sid])
+                sid = adj[sid]['next']
 
         # We need to find chains - i.e. 
         # series of services that have no prev node
@@ -155,6 +238,23 @@ class TimeTable:
                 # # print(chain[0])
                 self.allCyclesWtt.append(chain)
 
+        # linked services never reached from a starting node
+        # can only be on (or hang off) a linkedTo cycle
+        for sid in idMap:
+            if sid in visited or adj[sid]['next'] is None:
+                continue
+            cycle, onPath = [], {}
+            while sid and sid in idMap and sid not in visited:
+                if sid in onPath:
+                    self.chainDiagnostics.append(ChainDiagnostic(ChainIssue.CYCLE, cycle[onPath[sid]:]))
+                    break
+                onPath[sid] = len(cycle)
+                cycle.append(sid)
+                sid = adj[sid]['next']
+            visited.update(cycle)
+
+        for diag in self.chainDiagnostics:
+            logger.warning(f"WTT linkedTo {diag}")
         # print(f"Constructed {len(self.allCyclesWtt)} rake-cycle paths.")
         # for path in self.allCyclesWtt:
         #     # print(path[0])
@@ -176,18 +276,17 @@ class TimeTable:
         # undefined by mentioned in syummary are ignored.
         # "For a given rc in the set of rakecycles created on the set of defined services, 
         # are there any services that are not defined"
-        allServices = {str(s.serviceId[0]): s for s in self.suburbanServices}
-        s = allServices.get(str(sid)) 
+        s = self.suburbanIndex.get(serviceKey(sid))
         assert(s) # due to the suburbanservices creation step earlier
 
-        if any(str(sid) == str(sv.linkedTo) for sv in allServices.values()):
+        if self.linkedFrom.get(serviceKey(sid)):
             logger.debug(f"Service {sid} appears as a linkedTo of another service in WTT. Possible mislink in rakecycle {linkName}.")
             logger.info("Treat summary as source of truth. Reconstruct path using the serviceIds in the summary")
             path = []
             # # print(rc.serviceIds)
             for id in rc.serviceIds:
                 # # print(f"aha {id}")
-                svc = allServices.get(str(id)) 
+                svc = self.suburbanIndex.get(serviceKey(id))
                 assert(svc)
                 path.append(svc)
             # logger.debug(path)
@@ -195,6 +294,8 @@ class TimeTable:
 
     # creates stationEvents
     def generateRakeCycles(self):
+        if not self.serviceIndex:
+            self.indexServices() # timetables cached before the index existed
         self.suburbanServices.sort(
             key=lambda sv: (
                 isinstance(sv.serviceId[0], int),  # False (0) for strings, True (1) for ints
@@ -204,13 +305,20 @@ class TimeTable:
         # for sv in self.suburbanServices:
             # print(sv)
 
+        start = time.time()
         self.makeRakeCyclePathsSV(self.suburbanServices)
         # print(f"# rake links = {len(self.allCyclesWtt)}")
 
-        for path in self.allCyclesWtt:
-            # print(f"rakecycle starting with service {path[0].serviceId} has length = {len(path)}")
-            sidpath = [s.serviceId[0] for s in path] # from summary
-            # print(sidpath)
+        # head of chain -> chain, and the reverse of linkedTo,
+        # for O(1) matching and repair of summary links.
+        # fixPath resolves summary ids by first id among the suburban
+        # services, the last one in sorted order winning on a repeated id
+        self.chainHeads = {serviceKey(path[0].serviceId[0]): path for path in self.allCyclesWtt}
+        self.suburbanIndex = {serviceKey(sv.serviceId[0]): sv for sv in self.suburbanServices}
+        self.linkedFrom = defaultdict(list)
+        for sv in self.suburbanIndex.values():
+            if sv.linkedTo:
+                self.linkedFrom[serviceKey(sv.linkedTo)].append(sv)
 
         # need to link the paths to the rake linkNames
         # wtt.rakeclcyes rc contain the linkname
@@ -221,19 +329,12 @@ class TimeTable:
         invalid = []
         for rc in self.rakecycles:
             # print(rc.serviceIds)
-            # print("---")
-            # print(str(rc.serviceIds[0]))
-            # print("---")
-            for path in self.allCyclesWtt:
-                # print(f"ahaha {str(path[0].serviceId[0])}")
-                if str(rc.serviceIds[0]) == str(path[0].serviceId[0]):
-                    # print(f"adding path of length {len(path)}")
-                    rc.servicePath = path
-                # else:
-                #     logger.debug("Mismatch between wtt and summary init")
-                #     logger.debug(f"summ: {str(rc.serviceIds[0])}, wtt: {str(path[0].serviceId[0])}")
+            path = self.chainHeads.get(serviceKey(rc.serviceIds[0]))
+            if path:
+                # print(f"adding path of length {len(path)}")
+                rc.servicePath = path
             if not rc.servicePath:
-                logger.debug(f"Link {rc.linkName}: Summ starts with: {str(rc.serviceIds[0])}, wtt starts with: {str(path[0].serviceId[0])}")
+                logger.debug(f"Link {rc.linkName}: Summ starts with: {str(rc.serviceIds[0])}, no wtt chain starts there")
                 # print(f"Issue with serviceIdpath: {rc.linkName}") # every rakecycle must be assigned its path by the end.
                 logger.warning(f"Unable to match rakelink {rc.linkName} to a wtt-derived service-path. Fixing...")
                 fixedPath = self.fixPath(rc)
@@ -248,6 +349,7 @@ class TimeTable:
             self.rakecycles.remove(rc)
 
         logger.debug(f"# Rakecycles after fixing: {len(self.rakecycles)}")
+        logger.info(f"Matched {len(self.rakecycles)} rake links to {len(self.allCyclesWtt)} wtt chains in {time.time() - start:.3f}s")
 
         # validate paths:
         # in class rakecycle, serviceIDs[] reps the service serires
@@ -266,13 +368,17 @@ class TimeTable:
         # to extract timings and create StationEvents.
         # services not in the valid rakecycles will
         # not have events. 
+        # Services that already have events (from an earlier
+        # generate with another summary) are not re-extracted.
+        generated = set()
         for rc in self.rakecycles:
             # print(rc.servicePath)
             if not rc.servicePath:
                 # print(rc)
                 pass
             for svc in rc.servicePath:
-                svc.generateStationEvents()
+                svc.generateStationEvents(self)
+                generated.add(id(svc))
                 assert(svc.events)
                 svc.initStation = self.stations[svc.events[0].atStation]   
                 svc.finalStation = self.stations[svc.events[-1].atStation]
@@ -282,9 +388,21 @@ class TimeTable:
                 rc.lengthKm += svc.lengthKm
             print(f"Length of {rc.linkName} = {rc.lengthKm} Km")
 
+        # the events are extracted, the sheet indexes are rebuilt
+        # from xlsxSheets if they are ever needed again
+        self.sheetIndexes = {}
+
         # assign rakes to rakecycles
         self.assignRakes()
 
+        # columnar copy of the events for bulk and per-station queries
+        self.eventTable = EventTable(
+            [svc for svc in self.suburbanServices if id(svc) in generated],
+            self.stations.keys()
+        )
+        self.spanIndex = SpanIndex(*self.eventTable.serviceSpans())
+        self.rakeCyclesGenerated = True
+
         # for rc in self.rakecycles:
         #     self.generateRakeCyclePath(rc) 
     def assignRakes(self):
@@ -309,8 +427,12 @@ class TimeTable:
     # 3. Services in down direction
     # 4. num AC services
     # 5. In a certain time-period, how many services runnning?
-    def printStatistics(self):
-        pass
+    def printStatistics(self, window=None):
+        '''Print and return the TimeTableStats of this timetable.
+        window: (t_lower, t_upper) minutes for the running-services count.'''
+        stats = TimeTableStats(self, window)
+        print(stats)
+        return stats
 
     def validateRakeCycles(self):
         cycles = self.rakecycles
@@ -344,6 +466,8 @@ class TimeTable:
 
 class Rake:
     '''Physical rake specifications.'''
+    __slots__ = ("rakeId", "isAC", "rakeSize", "velocity", "assignedToLink")
+
     def __init__(self, rakeId):
         self.rakeId = rakeId
         self.isAC = False
@@ -357,6 +481,11 @@ class Rake:
 class RakeCycle:
     # A rake cycle is the set of stations that a particular rake covers in a 
     # day, aka Rake-Link
+    __slots__ = (
+        "rake", "status", "linkName", "serviceIds", "undefinedIds",
+        "startDepot", "endDepot", "servicePath", "render", "lengthKm",
+    )
+
     def __init__(self, linkName): # linkName comes from summary sheet.
         self.rake = None
         self.status = RakeLinkStatus.VALID
@@ -413,6 +542,23 @@ class RakeLinkStatus(Enum):
     VALID = 'valid'
     INVALID = 'invalid'
 
+class ChainIssue(Enum):
+    CYCLE = 'cycle' # services linkedTo each other in a loop
+    FORK = 'fork' # a service linkedTo from more than one service
+
+class ChainDiagnostic:
+    '''A malformed part of the WTT linkedTo graph.
+    serviceIds: the loop for a CYCLE, the predecessors then the shared
+    successor for a FORK.'''
+    def __init__(self, issue, serviceIds):
+        self.issue = issue
+        self.serviceIds = serviceIds
+
+    def __repr__(self):
+        if self.issue == ChainIssue.CYCLE:
+            return f"<cycle {' -> '.join(map(str, self.serviceIds + self.serviceIds[:1]))}>"
+        return f"<fork {', '.join(map(str, self.serviceIds[:-1]))} -> {self.serviceIds[-1]}>"
+
 # initially we onl handle regular suburban trains
 # excluding dahanu road 
 # services
@@ -440,8 +586,15 @@ class Day(Enum):
 
 class Service:
     '''Purely what can be extracted from a single column'''
+    # slotted, a WTT has ~1900 of these
+    __slots__ = (
+        "colIdx", "type", "zone", "serviceId", "direction",
+        "rakeLinkName", "rakeSizeReq", "needsACRake", "initStation", "linkedTo",
+        "finalStation", "events", "activeDates", "render", "lengthKm",
+    )
+
     def __init__(self, type: ServiceType):
-        self.rawServiceCol = None
+        self.colIdx = None # position of the service column in its sheet
         self.type = type # regular, stabling, multi-service
         self.zone = None # western, central
         self.serviceId = None # a list
@@ -574,92 +727,58 @@ class Service:
         # assert(l > 0)
         self.lengthKm = l
 
-    def generateStationEvents(self):
-        sheet = None
-        if self.direction == Direction.UP:
-            sheet = TimeTableParser.wttSheets[0]
-        else:
-            sheet = TimeTableParser.wttSheets[1]
+    def generateStationEvents(self, wtt):
+        '''Create the StationEvents of this service from its column in the
+        wtt's sheet. Does nothing if the events already exist.'''
+        if self.events:
+            return
+        sheetIdx = wtt.sheetIndex(self.direction)
+        col = self.colIdx
+
+        stationRows = sheetIdx.stationRows
 
         stName = None
-        serviceCol = self.rawServiceCol
-        # print(serviceCol)
-        for rowIdx, cell in serviceCol.items():
-            match = TimeTableParser.rTimePattern.search(str(cell))
-            if match:
-                tCell = match.group(0)
-                stName= sheet.iat[rowIdx, 0]
-                # # print(stName)
-                # this can be made better
-                if pd.isna(stName) or not str(stName).strip():
-                    # check row above
-                    stName = sheet.iat[rowIdx - 1, 0]
-                    if pd.isna(stName) or not str(stName).strip():
-                        stName = sheet.iat[rowIdx - 2, 0]
-                # stName = str(self.stationCol.iloc[rowIdx]).strip().upper()
-                if str(stName).strip() == "M'BAI CENTRAL (L)":
-                    # hack special case. 
-                    # make names identical in wtt is the right solution
-                    stName = "M'BAI CENTRAL(L)" 
-                if str(stName).strip().upper() == "KANDIVLI":
-                    # hack special case. 
-                    # make names identical in wtt is the right solution
-                    stName = "KANDIVALI" 
-                if str(stName).strip() in TimeTableParser.stations.keys():
-                    station = TimeTableParser.stations[str(stName).strip()]
-                    # # print(f"Last station from time: {str(stName).strip()}")
-                    # print(f"Got valid station from time: {station.name}")
-                elif "REVERSED" in str(stName).upper():
-                    # The timing in the reversed as belongs to the last station with
-                    # a valid time, not the station above
-                    # print("reversal")
-                    # check row above
-                    stName= sheet.iat[rowIdx - 1, 0]
-                    if pd.isna(stName) or not str(stName).strip():
-                        stName = sheet.iat[rowIdx - 2, 0]
-                    
-                    stName = self.events[-1].atStation
-                
-                stName = stName.strip().upper()
-                
-                # check arrival and departure
-                # at a time cell, is it near an A or D cell.
-                # if so, there is some dwell.
-                # print(sheet.iat[rowIdx, 1])
-                # isDTime = True if sheet.iat[rowIdx, 1] == "D" else False
-                isATime = True if sheet.iat[rowIdx, 1] == "A" else False
-
-                # assuming A always before D
-                if isATime:
-                    tArr = str(tCell).strip()
-                    e1 = StationEvent(stName, self, tArr, EventType.ARRIVAL)
-                    # assert next time is a D time
-                    isDTime = True if sheet.iat[rowIdx+1, 1] == "D" else False
-                    self.events.append(e1)
-                    TimeTableParser.eventsByStationMap[stName].append(e1)
-                    # # print(sheet.iat[rowIdx+1, 1])
-                    if isDTime:
-                        tDep = str(serviceCol.iloc[rowIdx + 1]).strip()
-                        # print(tDep)
-                        # assert tDep is a time
-                        if TimeTableParser.rTimePattern.match(tDep):
-                            # print("boom")
-                            e2 = StationEvent(stName, self, tDep, EventType.DEPARTURE)
-                            self.events.append(e2)
-                            TimeTableParser.eventsByStationMap[stName].append(e2)
-                    else:
-                        # probably the last station
-                        # nothing to do
-                        pass
+        # rows of this service's column holding a time,
+        # from the sheet-wide time matrix
+        for rowIdx in sheetIdx.timeRows(col):
+            tCell = sheetIdx.minutes[rowIdx, col]
+            if stationRows.reversal[rowIdx]:
+                # The timing in the reversed as belongs to the last station with
+                # a valid time, not the station above
+                stName = self.events[-1].atStation
+            else:
+                stName = stationRows.names[rowIdx]
+                if stName is None:
+                    raise ValueError(f"No station name near row {rowIdx} for service {self.serviceId}")
+            
+            # check arrival and departure
+            # at a time cell, is it near an A or D cell.
+            # if so, there is some dwell.
+            isATime = True if sheetIdx.markers[rowIdx] == "A" else False
+
+            # assuming A always before D
+            if isATime:
+                e1 = StationEvent(stName, self, tCell, EventType.ARRIVAL)
+                # assert next time is a D time
+                isDTime = True if sheetIdx.markers[rowIdx + 1] == "D" else False
+                self.events.append(e1)
+                if isDTime:
+                    # assert tDep is a time
+                    if sheetIdx.isTime[rowIdx + 1, col]:
+                        tDep = sheetIdx.minutes[rowIdx + 1, col]
+                        e2 = StationEvent(stName, self, tDep, EventType.DEPARTURE)
+                        self.events.append(e2)
                 else:
-                    # time at a non-A spot, single event
-                    # arrival-departure events will be with a single time.
-                    # we assume the gap between arrival departure is small, 
-                    # but arrival time is specified in the wtt.
-                    time = str(tCell).strip()
-                    e = StationEvent(stName, self, time, EventType.ARRIVAL)
-                    self.events.append(e)
-                    TimeTableParser.eventsByStationMap[stName].append(e)
+                    # probably the last station
+                    # nothing to do
+                    pass
+            else:
+                # time at a non-A spot, single event
+                # arrival-departure events will be with a single time.
+                # we assume the gap between arrival departure is small, 
+                # but arrival time is specified in the wtt.
+                e = StationEvent(stName, self, tCell, EventType.ARRIVAL)
+                self.events.append(e)
 
         # print(f"For service {self.serviceId}, events are:")
         # for ev in self.events:
@@ -689,37 +808,243 @@ class EventType(Enum):
 
     
 class StationEvent:
+    # slotted, there are tens of thousands of these
+    __slots__ = ("atStation", "ofService", "atTime", "platform", "eType", "render")
+
     def __init__(self, st, sv, time, type):
         self.atStation = st
         self.ofService = sv
-        self.atTime = self._timeToMinutes(time)
+        # minutes (e.g. from a SheetIndex) or a time cell
+        self.atTime = float(time) if isinstance(time, (int, float)) else timeToMinutes(time)
 
         self.platform = None
-        self.eType = None
+        self.eType = type
         self.render = True
-    
-    def _timeToMinutes(self, time_str):
-        '''Convert time string to minutes since midnight, with wrap-around.'''
-        if not time_str:
+
+
+# Services running past midnight are timed 24:00+,
+# anything before 02:45 belongs to the previous day.
+WRAP_AROUND_MINUTES = 165
+
+# HH:MM or HH:MM:SS, optionally prefixed by a date (27/11/24 or 2024-11-27,
+# as str() renders Excel datetime cells).
+rClockPattern = re.compile(
+    r'^\s*(?:(?:\d{1,2}/\d{1,2}/\d{2,4}|\d{4}-\d{2}-\d{2})[\sT]+)?'
+    r'(?P<h>\d{1,2}):(?P<m>\d{2})(?::(?P<s>\d{2})(?:\.\d+)?)?\s*$'
+)
+
+def serviceKey(sid):
+    '''Normalized service id: 5-digit ids (int or str) as int, ETY tokens as str.'''
+    if isinstance(sid, int):
+        return sid
+    sid = str(sid).strip()
+    return int(sid) if sid.isdigit() else sid
+
+def timeToMinutes(cell):
+    '''Minutes since midnight of a WTT time cell, with the 02:45 wrap-around.
+    Accepts HH:MM / HH:MM:SS strings (optionally date-prefixed) and
+    datetime.time / datetime.datetime cells. None if not a time.'''
+    if isinstance(cell, (datetime, dtime)):
+        h, m, sec = cell.hour, cell.minute, cell.second
+    elif isinstance(cell, str):
+        match = rClockPattern.match(cell)
+        if not match:
             return None
-        try:
-            t = datetime.strptime(time_str.strip(), "%H:%M:%S")
-        except:
-            try:
-                t = datetime.strptime(time_str.strip(), "%H:%M")
-            except:
-                return None
-        
-        minutes = t.hour * 60 + t.minute + t.second / 60
-        if minutes < 165:  # 2:45 AM wrap-around
-            minutes += 1440
-        return minutes
+        h, m = int(match.group("h")), int(match.group("m"))
+        sec = int(match.group("s")) if match.group("s") else 0
+        if h > 23 or m > 59 or sec > 59:
+            return None
+    else:
+        return None
+
+    minutes = h * 60 + m + sec / 60
+    if minutes < WRAP_AROUND_MINUTES:
+        minutes += 1440
+    return minutes
+
+def seriesToMinutes(series):
+    '''Batch timeToMinutes over a pandas Series of cells.
+    Returns a float Series, NaN where a cell is not a time.'''
+    # a WTT repeats the same few thousand times across the sheet,
+    # so parse each distinct cell once and broadcast.
+    codes, uniques = pd.factorize(series)
+    lookup = np.array([timeToMinutes(u) for u in uniques] + [None], dtype=float)
+    return pd.Series(lookup[codes], index=series.index) # code -1 (NaN cell) -> last entry
+
+
+class EventTable:
+    '''Columnar store of every StationEvent of the generated rake cycles.
+    Rows are grouped by service, in event order. Stations and services
+    are referred to by index into `stationNames` / `services`.'''
+    EVENT_TYPE_CODES = {EventType.ARRIVAL: 0, EventType.DEPARTURE: 1}
+
+    def __init__(self, services, stationNames):
+        self.services = list(services)
+        self.serviceIdx = {id(svc): i for i, svc in enumerate(self.services)}
+        self.stationNames = list(stationNames)
+        self.stationIdx = {name: i for i, name in enumerate(self.stationNames)}
+
+        self.events = [e for svc in self.services for e in svc.events] # row -> StationEvent
+        n = len(self.events)
+        self.station = np.empty(n, dtype=np.int16)
+        self.service = np.empty(n, dtype=np.int32)
+        self.time = np.empty(n, dtype=np.float64) # minutes since midnight, NaN if unparsed
+        self.eType = np.empty(n, dtype=np.int8)
+        self.render = np.ones(n, dtype=bool)
+
+        # serviceOffsets[i]:serviceOffsets[i+1] are the rows of services[i]
+        counts = np.fromiter((len(svc.events) for svc in self.services), dtype=np.int64, count=len(self.services))
+        self.serviceOffsets = np.zeros(len(self.services) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.serviceOffsets[1:])
+        self.service[:] = np.repeat(np.arange(len(self.services), dtype=np.int32), counts)
+
+        for row, e in enumerate(self.events):
+            if e.atStation not in self.stationIdx:
+                # not a registered station, give it an index anyway
+                self.stationIdx[e.atStation] = len(self.stationNames)
+                self.stationNames.append(e.atStation)
+            self.station[row] = self.stationIdx[e.atStation]
+            self.time[row] = np.nan if e.atTime is None else e.atTime
+            self.eType[row] = EventTable.EVENT_TYPE_CODES.get(e.eType, -1)
+
+        # byStation: rows grouped by station and sorted by time within a station.
+        # rows of station j are byStation[stationOffsets[j]:stationOffsets[j+1]]
+        self.byStation = np.lexsort((self.time, self.station))
+        stCounts = np.bincount(self.station, minlength=len(self.stationNames))
+        self.stationOffsets = np.zeros(len(self.stationNames) + 1, dtype=np.int64)
+        np.cumsum(stCounts, out=self.stationOffsets[1:])
+
+        # plot-ready copies for the dashboard, built on the first plotData
+        self.plotTimes = None # row -> whole minutes as int (shorter in the figure JSON), None if unparsed
+        self.hoverLabels = None # row -> "STATION @ HH:MM"
+
+    def formatLabels(self):
+        '''"STATION @ HH:MM" hover label of every row, formatting each
+        distinct time once. Rows without a time get "?".'''
+        names = np.array([str(name).strip().upper() for name in self.stationNames], dtype=object)
+        timed = ~np.isnan(self.time)
+        times, inverse = np.unique(self.time[timed], return_inverse=True)
+        clock = np.array([f"{(int(t)//60) % 24:02d}:{int(t%60):02d}" for t in times], dtype=object)
+        labels = np.full(len(self.events), "?", dtype=object)
+        labels[timed] = clock[inverse]
+        return (names[self.station] + " @ " + labels).tolist()
+
+    def plotData(self, svc):
+        '''(plotTimes, hoverLabels) of svc's events, None if svc has no rows here.'''
+        i = self.serviceIdx.get(id(svc))
+        if i is None:
+            return None
+        if self.hoverLabels is None:
+            # once per timetable; the CLI and exports never need them
+            self.plotTimes = [None if t != t else int(t) if t.is_integer() else t for t in self.time.tolist()]
+            self.hoverLabels = self.formatLabels()
+        rows = slice(self.serviceOffsets[i], self.serviceOffsets[i + 1])
+        return self.plotTimes[rows], self.hoverLabels[rows]
+
+    def __len__(self):
+        return len(self.events)
+
+    def stationRows(self, stName):
+        '''Rows of events at stName, sorted by time.'''
+        j = self.stationIdx.get(stName)
+        if j is None:
+            return self.byStation[:0]
+        return self.byStation[self.stationOffsets[j]:self.stationOffsets[j + 1]]
+
+    def stationWindow(self, stName, t_lower, t_upper):
+        '''Rows of events at stName with t_lower <= time <= t_upper, sorted by time.'''
+        rows = self.stationRows(stName)
+        times = self.time[rows]
+        lo = np.searchsorted(times, t_lower, side="left")
+        hi = np.searchsorted(times, t_upper, side="right")
+        return rows[lo:hi]
+
+    def serviceSpans(self):
+        '''(first, last) event time of every service, NaN for services without a timed event.'''
+        first = np.full(len(self.services), np.nan)
+        last = np.full(len(self.services), np.nan)
+        offsets = self.serviceOffsets
+        nonEmpty = offsets[1:] > offsets[:-1]
+        if nonEmpty.any():
+            starts = offsets[:-1][nonEmpty]
+            first[nonEmpty] = np.minimum.reduceat(np.where(np.isnan(self.time), np.inf, self.time), starts)
+            last[nonEmpty] = np.maximum.reduceat(np.where(np.isnan(self.time), -np.inf, self.time), starts)
+        untimed = ~np.isfinite(first)
+        first[untimed] = np.nan
+        last[untimed] = np.nan
+        return first, last
+
+    def inWindow(self, t_lower, t_upper):
+        '''Boolean mask of events with t_lower <= time <= t_upper.'''
+        return (self.time >= t_lower) & (self.time <= t_upper)
+
+    def syncRender(self):
+        '''Push the render column back onto the StationEvent objects.'''
+        for e, r in zip(self.events, self.render.tolist()):
+            e.render = r
+
+
+class SpanIndex:
+    '''Centered interval tree over [start, end] spans, answering
+    "which spans overlap [t_lower, t_upper]" in O(log n + k).
+    Spans with a NaN end point are left out.'''
+    def __init__(self, starts, ends):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        # node: (center, byStart, sortedStarts, byEnd, sortedEnds, left, right)
+        self.nodes = []
+        valid = np.flatnonzero(~np.isnan(self.starts) & ~np.isnan(self.ends))
+        self.root = self.build(valid)
+
+    def build(self, idx):
+        if not len(idx):
+            return -1
+        starts, ends = self.starts[idx], self.ends[idx]
+        # the median end point leaves at most half the spans on either side
+        center = np.median(np.concatenate([starts, ends]))
+        here = idx[(starts <= center) & (ends >= center)]
+        byStart = here[np.argsort(self.starts[here], kind="stable")]
+        byEnd = here[np.argsort(self.ends[here], kind="stable")]
+
+        node = len(self.nodes)
+        self.nodes.append(None)
+        left = self.build(idx[ends < center])
+        right = self.build(idx[starts > center])
+        self.nodes[node] = (center, byStart, self.starts[byStart], byEnd, self.ends[byEnd], left, right)
+        return node
+
+    def overlapping(self, t_lower, t_upper):
+        '''Sorted indices of the spans overlapping [t_lower, t_upper].'''
+        found = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node < 0:
+                continue
+            center, byStart, sortedStarts, byEnd, sortedEnds, left, right = self.nodes[node]
+            if t_upper < center:
+                # every span here ends after the window starts
+                found.append(byStart[:np.searchsorted(sortedStarts, t_upper, side="right")])
+                stack.append(left)
+            elif t_lower > center:
+                # every span here starts before the window ends
+                found.append(byEnd[np.searchsorted(sortedEnds, t_lower, side="left"):])
+                stack.append(right)
+            else:
+                found.append(byStart)
+                stack.append(left)
+                stack.append(right)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(found))
 
 
 # Activity at a station is dynamic with time
 # The activity is studied to generate rake-cycles
 # which is a sequence of station ids for every rake id.
 class Station:
+    __slots__ = ("id", "name", "large", "rakeHoldingCapacity", "events", "dCCGkm")
+
     def __init__(self, id, name):
         self.id = id
         self.name = name
@@ -727,6 +1052,137 @@ class Station:
         self.rakeHoldingCapacity = None # max rakes at this station at any given time.
         self.events = {} # {rakelinkName: [stationEvent]}
 
+# WTT spellings that differ from the station names in the header.
+# make names identical in wtt is the right solution
+stationAliases = {
+    "M'BAI CENTRAL (L)": "M'BAI CENTRAL(L)",
+    "KANDIVLI": "KANDIVALI",
+}
+
+def normaliseStationName(name):
+    '''Upper-cased, stripped station name with the known WTT spelling variants resolved.'''
+    name = str(name).strip().upper()
+    return stationAliases.get(name, name)
+
+class StationRows:
+    '''The station each row of a WTT sheet belongs to, resolved once per sheet.
+    Blank rows belong to the nearest name up to two rows above; a
+    "Reversed as" row keeps the station above it in reversedAt.'''
+    def __init__(self, sheet, stations):
+        raw = []
+        for v in sheet.iloc[:, 0]:
+            raw.append(None if pd.isna(v) or not str(v).strip() else str(v).strip())
+
+        n = len(raw)
+        self.names = [None] * n # upper-cased station name, None for unnamed rows
+        self.stations = [None] * n # <Station>, None if the name is not a station
+        self.reversal = [False] * n
+        self.reversedAt = [None] * n
+        for row in range(n):
+            name = raw[row]
+            if name is None and row >= 1:
+                name = raw[row - 1]
+                if name is None and row >= 2:
+                    name = raw[row - 2]
+            if name is None:
+                continue
+
+            name = normaliseStationName(name)
+            self.names[row] = name
+            if name in stations:
+                self.stations[row] = stations[name]
+            elif "REVERSED" in name:
+                self.reversal[row] = True
+                above = raw[row - 1] if row >= 1 else None
+                if above is None and row >= 2:
+                    above = raw[row - 2]
+                self.reversedAt[row] = stations.get(normaliseStationName(above)) if above else None
+
+class ColumnKind(Enum):
+    EMPTY = 'empty'
+    STATIONS = 'stations' # repeated station name column
+    ADAD = 'adad' # A/D marker column
+    SERVICE = 'service'
+
+class SheetIndex:
+    '''Lookup tables over a whole WTT sheet, computed once per upload so that
+    per-service work becomes array indexing instead of per-cell regex work.'''
+    def __init__(self, sheet, stations):
+        self.markers = sheet.iloc[:, 1].to_numpy() # A/D column
+        self.stationRows = StationRows(sheet, stations)
+        nRows, nCols = sheet.shape
+
+        # the one string conversion of the sheet, service columns are read
+        # from here; released once the services are registered
+        self.cells = sheet.astype(str)
+
+        # cells repeat heavily, so classify every distinct cell string once
+        raw = self.cells.to_numpy().ravel()
+        codes, uniques = pd.factorize(raw)
+        timeParts = [None] * len(uniques) # the time found in each distinct cell
+        timeMask = np.zeros(len(uniques) + 1, dtype=bool)
+        isTime = np.zeros(len(uniques) + 1, dtype=bool)
+        blank = np.zeros(len(uniques) + 1, dtype=bool)
+        isA = np.zeros(len(uniques) + 1, dtype=bool)
+        isD = np.zeros(len(uniques) + 1, dtype=bool)
+        for i, cell in enumerate(uniques):
+            word = cell.strip().upper()
+            blank[i] = not word or cell == "nan"
+            isA[i] = word == "A"
+            isD[i] = word == "D"
+            found = TimeTableParser.rTimePattern.search(cell.strip())
+            if not found:
+                continue
+            timeParts[i] = found.group(0)
+            timeMask[i] = bool(TimeTableParser.rTimePattern.search(cell))
+            isTime[i] = bool(TimeTableParser.rTimePattern.match(cell.strip()))
+        minutes = np.append(seriesToMinutes(pd.Series(timeParts, dtype=object)).to_numpy(), np.nan)
+
+        # minutes of every time cell, NaN elsewhere
+        self.minutes = minutes[codes].reshape(nRows, nCols)
+        # cell contains a time, as found by rTimePattern.search(cell)
+        self.timeMask = timeMask[codes].reshape(nRows, nCols)
+        # cell is a time, as matched by rTimePattern.match(cell.strip())
+        self.isTime = isTime[codes].reshape(nRows, nCols)
+        self.columnKinds = self.classifyColumns(
+            blank[codes].reshape(nRows, nCols),
+            isA[codes].reshape(nRows, nCols),
+            isD[codes].reshape(nRows, nCols),
+            np.array([c.strip().upper() == "STATIONS" for c in self.cells.iloc[0]]) if nRows else np.zeros(nCols, dtype=bool),
+        )
+
+    @staticmethod
+    def classifyColumns(blank, isA, isD, stationsHeader):
+        '''ColumnKind of every column, from the per-cell masks of the sheet.'''
+        empty = blank.all(axis=0)
+        # an A directly above a D
+        adad = (isA[:-1] & isD[1:]).any(axis=0)
+        kinds = np.select(
+            [empty, stationsHeader, adad],
+            [ColumnKind.EMPTY, ColumnKind.STATIONS, ColumnKind.ADAD],
+            default=ColumnKind.SERVICE
+        )
+        return kinds.tolist()
+
+    def serviceColumns(self, numCols):
+        '''Positions of the service columns among the first numCols columns.'''
+        return [idx for idx in range(2, min(numCols, len(self.columnKinds)))
+                if self.columnKinds[idx] == ColumnKind.SERVICE]
+
+    def timeRows(self, colIdx):
+        '''Row indices of the time cells in a column, top to bottom.'''
+        return np.flatnonzero(self.timeMask[:, colIdx])
+
+    def eventType(self, row):
+        '''EventType of a time in the given row, from the row's A/D marker
+        (column B, self.markers); the column's kind plays no part. A time on a
+        "D" row directly under an "A" row is a departure, every other time an
+        arrival.'''
+        if row >= 1 and self.markers[row] == "D" and self.markers[row - 1] == "A":
+            return EventType.DEPARTURE
+        return EventType.ARRIVAL
+
+
 # Create a TimeTable object. This is then plotted
 # via plotly-dash.
 # Algo:
@@ -748,8 +1204,6 @@ class TimeTableParser:
     # @290ct: not used
     rakeLinkNames = [] 
 
-    wttSheets = [] # upsheet, downsheet, summary sheets
-
     # From https://bhaaratham.com/list-of-stations-mumbai-local-train/
     distanceMap = {
         "CHURCHGATE": 0, "MARINE LINES": 2, "CHARNI ROAD": 3, "GRANT ROAD": 4,
@@ -761,11 +1215,21 @@ class TimeTableParser:
         "NAIGAON": 48, "VASAI ROAD": 52, "NALLASOPARA": 56, "VIRAR": 60
     }
 
-    eventsByStationMap = defaultdict(list)
+    # parsed timetables, keyed by hash of the uploaded workbooks
+    parseCache = ParseCache()
+    # registerServices process pool size, <= 1 parses in-process
+    parseWorkers = int(os.environ.get("WTT_PARSE_WORKERS", 0))
 
     def __init__(self, fpWttXlsx=None, fpWttSummaryXlsx=None):
         self.wtt = TimeTable()
         self.stationCol = None # df column with stations
+        self.stationMap = {} # station abbreviation: <Station>, see registerStations
+        self.reversalRow = None # row of the "Reversed as" entry, see registerStations
+        self.cacheKey = None # hash of the (wtt, summary) inputs, see inputKey
+        # hashes of the workbooks each parse stage last ran on, see refresh
+        self.wttHash = None # sheets + stations loaded
+        self.servicesHash = None # services registered
+        self.summaryHash = None # rake links parsed
 
         # if the req comes from a local test
         # i.e. python3 timetable.py
@@ -789,31 +1253,123 @@ class TimeTableParser:
         # for s in self.suburbanServices:
         #     # print(s.serviceId)
     @classmethod
-    def fromFileObjects(cls, wttFileObj, summaryFileObj):
-        '''Create TimeTableParser from BytesIO objects for uploaded files'''
-        instance = cls()
+    def fromFileObjects(cls, wttFileObj, summaryFileObj, useCache=True):
+        '''Create TimeTableParser from BytesIO objects for uploaded files.
+        A previously parsed identical (wtt, summary) pair is loaded from the parse cache.'''
+        return cls.fromWorkbooks(wttFileObj.read(), summaryFileObj.read(), useCache=useCache)
+
+    @classmethod
+    def fromWorkbooks(cls, wttBytes, summaryBytes=None, parser=None, useCache=True):
+        '''Parser for the given workbooks (summaryBytes None: the WTT alone).
+        `parser` is kept if it already holds them. Otherwise the parse cache is
+        looked up by hash before any workbook is loaded, first for the pair,
+        then for the WTT alone, and only the stages still missing are parsed.'''
+        key = cls.inputKey(wttBytes, summaryBytes)
+        wttHash = ParseCache.keyFor(wttBytes)
+        if parser and parser.wttHash == wttHash and (summaryBytes is None or parser.cacheKey == key):
+            return parser
+        if useCache:
+            cached = cls.fromCache(key)
+            if cached:
+                return cached
+
+        if not parser or parser.wttHash != wttHash:
+            # a new WTT, parsed before with another (or no) summary?
+            cached = cls.fromCache(cls.inputKey(wttBytes)) if useCache and summaryBytes is not None else None
+            parser = cached or cls()
+            if parser.refresh(wttBytes) and useCache:
+                parser.saveToCache() # the WTT alone, for the next summary
+        if summaryBytes is not None and parser.refresh(wttBytes, summaryBytes) and useCache:
+            parser.saveToCache()
+        return parser
+
+    def refresh(self, wttBytes, summaryBytes=None):
+        '''Bring the parse up to date with the given workbooks, redoing only
+        the stages whose input changed. A new Link Summary alone only re-parses
+        the rake links; station events of services are kept for the next
+        generateRakeCycles. Without a summary only the WTT stages run.
+        Returns True if anything was re-parsed.'''
+        wttHash = ParseCache.keyFor(wttBytes)
+        changed = False
+
+        if wttHash != self.wttHash:
+            self.wtt = TimeTable()
+            self.xlsxToDfFromFileObj(io.BytesIO(wttBytes))
+            self.registerStations()
+        if self.servicesHash != self.wttHash:
+            # this can be triggered when the 
+            # summary sheet is uploaded
+            self.registerServices()
+            self.servicesHash = self.wttHash
+            self.summaryHash = None # links must be matched to the new services
+            changed = True
+        summaryHash = ParseCache.keyFor(summaryBytes) if summaryBytes is not None else None
+        if summaryBytes is not None and summaryHash != self.summaryHash:
+            start = time.time()
+            self.wtt.resetRakeCycles()
+            self.parseWttSummaryFromFileObj(io.BytesIO(summaryBytes)) # creates rakecycles without timing info
+            self.wtt.suburbanServices = self.isolateSuburbanServices()
+            self.summaryHash = summaryHash
+            changed = True
+            logger.info(f"Link summary parsed in {time.time() - start:.3f}s")
+
+        self.cacheKey = self.inputKey(wttBytes, summaryBytes)
+        return changed
+
+    @staticmethod
+    def inputKey(wttBytes, summaryBytes=None):
+        '''Cache key for a (wtt, summary) pair of uploaded workbooks, or for the WTT alone.'''
+        if summaryBytes is None:
+            return ParseCache.keyFor(wttBytes)
+        return ParseCache.keyFor(wttBytes, summaryBytes)
+
+    @classmethod
+    def fromCache(cls, key):
+        '''Restore a parser from the parse cache. Returns None on a miss.'''
         start = time.time()
-        instance.xlsxToDfFromFileObj(wttFileObj)
-        instance.registerStations()
-        end = time.time()
-
-        # this can be triggered when the 
-        # summary sheet is uploaded
-        instance.registerServices()
-        print(f"time in: {end - start}")
-        instance.parseWttSummaryFromFileObj(summaryFileObj) # creates rakecycles without timing info
-        instance.wtt.suburbanServices = instance.isolateSuburbanServices()
+        snapshot = cls.parseCache.load(key)
+        if snapshot is None:
+            return None
+
+        instance = cls()
+        instance.cacheKey = key
+        instance.wtt = snapshot["wtt"]
+        instance.upSheet = snapshot["upSheet"]
+        instance.downSheet = snapshot["downSheet"]
+        instance.stationCol = snapshot["stationCol"]
+        instance.wttSummarySheet = snapshot["wttSummarySheet"]
+        instance.stationMap = snapshot["stationMap"]
+        instance.wttHash = snapshot["wttHash"]
+        instance.servicesHash = snapshot["servicesHash"]
+        instance.summaryHash = snapshot["summaryHash"]
+        logger.info(f"Loaded parsed timetable {key[:12]} from cache in {time.time() - start:.3f}s")
         return instance
 
+    def saveToCache(self):
+        '''Store the current parse state (services, rake cycles and, once
+        generated, station events) under this parser's input key.'''
+        if not self.cacheKey:
+            return
+        start = time.time()
+        snapshot = {
+            "wtt": self.wtt,
+            "upSheet": self.upSheet,
+            "downSheet": self.downSheet,
+            "stationCol": self.stationCol,
+            "wttSummarySheet": getattr(self, "wttSummarySheet", None),
+            "stationMap": self.stationMap,
+            "wttHash": self.wttHash,
+            "servicesHash": self.servicesHash,
+            "summaryHash": self.summaryHash,
+        }
+        TimeTableParser.parseCache.store(self.cacheKey, snapshot)
+        logger.info(f"Cached parsed timetable {self.cacheKey[:12]} in {time.time() - start:.3f}s")
+
     def xlsxToDfFromFileObj(self, fileObj):
         '''Parse Excel from file object instead of path'''
-        xlsx = pd.ExcelFile(fileObj)
-        for sheet in xlsx.sheet_names:
-            df = xlsx.parse(sheet, skiprows=4).dropna(axis=1, how='all')
-            TimeTableParser.wttSheets.append(df)
-            
-        self.upSheet = TimeTableParser.wttSheets[0]
-        self.downSheet = TimeTableParser.wttSheets[1]
+        wttBytes = fileObj.read()
+        self.wttHash = ParseCache.keyFor(wttBytes)
+        self.xlsxToDf(io.BytesIO(wttBytes))
 
     def parseWttSummaryFromFileObj(self, fileObj):
         '''Parse summary Excel from file object instead of path'''
@@ -834,6 +1390,7 @@ class TimeTableParser:
             seen |= s
         # print(repeated)
         
+        # every column carrying a summary id, a service id may appear in more than one
         suburbanServices = []
         for s in (self.wtt.upServices + self.wtt.downServices):
             if any(sid in suburbanIds for sid in s.serviceId):
@@ -843,8 +1400,9 @@ class TimeTableParser:
         return suburbanServices
 
     def parseRakeLinks(self, sheet):
-        allServices = self.wtt.upServices + self.wtt.downServices
-        # print(len(allServices))
+        start = time.time()
+        if not self.wtt.serviceIndex:
+            self.wtt.indexServices()
         sheet = sheet.reset_index(drop=True)
 
         # print(f"Summary sheet rows: {len(sheet)}")
@@ -887,12 +1445,14 @@ class TimeTableParser:
 
             for sid in sIds:
                 rc.serviceIds.append(sid) # serviceIds stores every sid in summary
-                service = next((s for s in allServices if sid in s.serviceId), None)
+                service = self.wtt.getService(sid)
                 if not service:
                     rc.undefinedIds.append((linkName, sid)) # but we also mark undefined services
 
             self.wtt.rakecycles.append(rc) # servicepaths not yet created.
 
+        logger.info(f"Parsed {len(self.wtt.rakecycles)} rake links in {time.time() - start:.3f}s")
+
         # summary
         if rc.undefinedIds:
             print(f"\n{len(rc.undefinedIds)} service IDs from summary sheet not found in detailed WTT:")
@@ -909,37 +1469,60 @@ class TimeTableParser:
         self.parseRakeLinks(self.wttSummarySheet)
 
     def xlsxToDf(self, filePathXlsx):
-        xlsx = pd.ExcelFile(filePathXlsx)
-        for sheet in xlsx.sheet_names:
-            # First row is blank, followed by the station row # onwards
-            # with skipped=4. skipped=5 removes the extra white row above the main content.
-            df = xlsx.parse(sheet, skiprows=4).dropna(axis=1, how='all')
-            TimeTableParser.wttSheets.append(df)
-            # remove fully blank columns
-            
-        self.upSheet = TimeTableParser.wttSheets[0]
-        self.downSheet = TimeTableParser.wttSheets[1]
+        '''Load the UP and DOWN sheets. filePathXlsx may also be a file object.'''
+        start = time.time()
+        wb = openpyxl.load_workbook(filePathXlsx, read_only=True, data_only=True)
+        try:
+            # only the first two sheets are used
+            self.upSheet = TimeTableParser.readWttSheet(wb.worksheets[0], UP_TT_COLUMNS)
+            self.downSheet = TimeTableParser.readWttSheet(wb.worksheets[1], DOWN_TT_COLUMNS)
+        finally:
+            wb.close()
+        self.wtt.xlsxSheets = [self.upSheet, self.downSheet]
+        logger.info(f"Loaded WTT sheets {self.upSheet.shape}, {self.downSheet.shape} in {time.time() - start:.2f}s")
+
+    @staticmethod
+    def readWttSheet(ws, numCols):
+        '''Stream a read-only openpyxl worksheet into a DataFrame.
+        Same frame as pd.ExcelFile.parse(sheet, skiprows=4).dropna(axis=1, how='all'),
+        cut to the first numCols columns, without materialising the rest of the workbook.'''
+        # cells converted the way pandas' openpyxl reader does
+        rows = []
+        lastRow = -1
+        ws.reset_dimensions() # read-only sheets may carry stale dimensions
+        for row in ws.iter_rows(min_row=WTT_SKIP_ROWS + 1, values_only=True):
+            cells = [
+                "" if v is None else int(v) if isinstance(v, float) and v.is_integer() else v
+                for v in row
+            ]
+            while cells and cells[-1] == "":
+                cells.pop()
+            if cells:
+                lastRow = len(rows)
+            rows.append(cells)
+        rows = rows[:lastRow + 1] # trailing blank rows
+
+        width = max((len(r) for r in rows), default=0)
+        rows = [r + [""] * (width - len(r)) for r in rows]
+
+        # First row is blank, followed by the station row # onwards.
+        # The first streamed row is the header, as with parse(skiprows=4).
+        # TextParser applies the same NA and dtype inference as read_excel.
+        df = TextParser(rows, header=0).read()
+        # remove fully blank columns
+        return df.dropna(axis=1, how='all').iloc[:, :numCols]
     
     # always use cleancol before working with a column
-    def cleanCol(self, sheet, colIdx):
-        '''Return the column as-is unless it is entirely NaN or whitespace.'''
-        clean = sheet.iloc[:, colIdx].astype(str)
-
-        # Check if all entries are NaN or whitespace (after conversion to str)
-        if clean.isna().all() or clean.str.fullmatch(r'(nan|\s*)', na=False).all():
-            return pd.Series(dtype=str)
-
-        # if (colIdx == 0):
-        #     mask =  clean.str.fullmatch(r'\s*')
-        #     # invert mask to keep non-blank rows
-        #     clean = clean[~mask]
-
-        return clean
-
     def registerStations(self):
         '''Create an object corresponding to every station on the network'''
         sheet = self.upSheet # a dataframe
         self.stationCol = sheet.iloc[:, 0]
+
+        # The up sheet's reversal row locates the linkedTo rows of both sheets,
+        # see extractLinkedTo
+        mask = self.stationCol.str.contains("Reversed as", case=False, na=False)
+        match = self.stationCol[mask]
+        self.reversalRow = match.index[0] if not match.empty else None
         # self.stationCol = self.cleanCol(sheet, 0) # 0 column index of station
         # # print(stationCol)
         # # print((self.stationCol[1:-8])) 
@@ -959,7 +1542,7 @@ class TimeTableParser:
             # print(f"station {st.name} distance from CCG: {st.dCCGkm}")
         
         # create station map
-        TimeTableParser.stationMap = {
+        self.stationMap = {
             "BDTS": self.wtt.stations["BANDRA"],
             "BA": self.wtt.stations["BANDRA"],
             "MM": self.wtt.stations["MAHIM JN."],
@@ -975,15 +1558,13 @@ class TimeTableParser:
             "MX": self.wtt.stations["MAHALAKSHMI"]
         }
 
-        TimeTableParser.stations = self.wtt.stations
-
     # First station with a valid time
     # "EX ..."
     # else First station in Stations i.e. VIRAR
-    def extractInitStation(self, serviceCol, sheet):
+    def extractInitStation(self, serviceCol, stationRows):
         '''Determines the first arrival station in the service path.
         serviceCol: pandas.Series
-        sheet: pandas.Dataframe'''
+        stationRows: StationRows of the service's sheet'''
         # # print(serviceCol)
 
         # for every column:
@@ -992,37 +1573,17 @@ class TimeTableParser:
         # also check for A, D
         # if station name found, that station is the init station.
         ## if name in self.wtt.stations.keys(): its a starting time
-        stationName = None
+        station = None
         for rowIdx, cell in serviceCol.items():
             if TimeTableParser.rTimePattern.match(cell):
-                stationName = sheet.iat[rowIdx, 0]
-                # row = sheet.iloc[rowIdx, :].astype(str)
-                # stationName = row.iloc[0]
-                # # print(f"{stationName}: {cell}")
-
-                if pd.isna(stationName) or not str(stationName).strip():
-                    # check row above if possible
-                    if rowIdx > 0:
-                        stationName = sheet.iat[rowIdx - 1, 0]
+                station = stationRows.stations[rowIdx]
                 break
 
-        if pd.isna(stationName) or not str(stationName).strip():
+        if not station:
             raise ValueError(f"Invalid station name near row {rowIdx}")
-        
-        # # print(self.wtt.stations.keys())
-        if stationName == "M'BAI CENTRAL (L)":
-            # hack special case. 
-            # make names identical in wtt is the right solution
-            stationName = "M'BAI CENTRAL(L)" 
-        
-        if stationName.upper() == "KANDIVLI":
-            stationName = "KANDIVALI"
-
-        station = self.wtt.stations[stationName.strip().upper()]
-        assert(station)
         return station
         
-    def extractFinalStation(self, serviceCol, sheet):
+    def extractFinalStation(self, serviceCol, stationRows):
         # ARRL., Arr, ARR
         # last station with a timing
         # last station in stations, i.e. CCG
@@ -1034,7 +1595,7 @@ class TimeTableParser:
 
         # else:
         # return the station associated with the last time
-        abbrStations = TimeTableParser.stationMap.keys()
+        abbrStations = self.stationMap.keys()
         station = None
         arrlRowIdx = None
 
@@ -1053,36 +1614,13 @@ class TimeTableParser:
             for rowIdx in reversed(serviceCol.index):
                 cell = str(serviceCol.iloc[rowIdx]).strip()
                 if TimeTableParser.rTimePattern.match(cell):
-                    stName= sheet.iat[rowIdx, 0]
-                    # # print(stName)
-                    # this can be made better
-                    if pd.isna(stName) or not str(stName).strip():
-                        # check row above
-                        stName = sheet.iat[rowIdx - 1, 0]
-                        if pd.isna(stName) or not str(stName).strip():
-                            stName = sheet.iat[rowIdx - 2, 0]
-                    # stName = str(self.stationCol.iloc[rowIdx]).strip().upper()
-                    if str(stName).strip() == "M'BAI CENTRAL (L)":
-                        # hack special case. 
-                        # make names identical in wtt is the right solution
-                        stName = "M'BAI CENTRAL(L)" 
-                    if str(stName).strip().upper() == "KANDIVLI":
-                        # hack special case. 
-                        # make names identical in wtt is the right solution
-                        stName = "KANDIVALI" 
-                    if str(stName).strip() in self.wtt.stations.keys():
-                        station = self.wtt.stations[str(stName).strip()]
-                        # print(f"Last station from time: {str(stName).strip()}")
-                        return station
-                    elif "REVERSED" in str(stName).upper():
-                        # # print("reversal")
-                        # check row above
-                        stName= sheet.iat[rowIdx - 1, 0]
-                        if pd.isna(stName) or not str(stName).strip():
-                            stName = sheet.iat[rowIdx - 2, 0]
-                        station = self.wtt.stations[str(stName).strip()]
-                        # print(f"Last station from time,: {str(stName).strip()}")
+                    station = stationRows.stations[rowIdx]
+                    if station:
+                        # print(f"Last station from time: {station.name}")
                         return station
+                    elif stationRows.reversal[rowIdx]:
+                        # the station above the reversal
+                        return stationRows.reversedAt[rowIdx]
 
             # print("Could not determine final station (no ARRL or valid time)")
             return station
@@ -1111,7 +1649,7 @@ class TimeTableParser:
             if stationName:
                 # found a valid station in/near the ARRL region
                 # print(f"found stationname {stationName} from row {r}: {cellVal}")
-                station = TimeTableParser.stationMap[stationName]
+                station = self.stationMap[stationName]
                 # # print(station)
                 return station
 
@@ -1124,47 +1662,34 @@ class TimeTableParser:
         are specified in the WTT-Summary Sheet.'''
         pass
     
-    def extractLinkedToNext(self, serviceCol, direction):
-        '''Find the linked service (if any) following a 'Reversed as' entry.'''
-        # dropNa
-        serviceCol = serviceCol.dropna()
-        mask = self.stationCol.str.contains("Reversed as", case=False, na=False)
-        match = self.stationCol[mask]
-
-        if match.empty:
-            return None
-
-        rowIdx = match.index[0]
-        # print(rowIdx)
-        # # print(serviceCol)
-
-        # Guard
-        if rowIdx not in serviceCol.index:
-            return None
+    def extractLinkedTo(self, sheet, direction):
+        '''The linked service (if any) following the 'Reversed as' entry, for
+        every column of the sheet in one read of the reversal rows.
+        Returns a list indexed by column position, None where there is no link.'''
+        nCols = sheet.shape[1]
+        rowIdx = self.reversalRow
+        if rowIdx is None:
+            return [None] * nCols
 
         # for lower sheet, the idx are idx -1, idx
         if (direction == Direction.UP):
-            depTime = serviceCol.loc[rowIdx]
-            linkedService = serviceCol.loc[rowIdx + 1]
+            depRow, sidRow = rowIdx, rowIdx + 1
         else:
-            depTime = serviceCol.loc[rowIdx -1]
-            linkedService = serviceCol.loc[rowIdx]
-
-
-        # Convert safely, handle NaN/None/float cases
-        if pd.isna(linkedService) or pd.isna(depTime):
-            return None
+            depRow, sidRow = rowIdx - 1, rowIdx
+        # Guard
+        if depRow < 0 or sidRow >= len(sheet):
+            return [None] * nCols
 
-        depTime = str(depTime).strip()
-        linkedService = str(linkedService).strip()
+        rows = sheet.iloc[[depRow, sidRow]].astype(str)
+        depTime = rows.iloc[0].str.strip()
+        linkedService = rows.iloc[1].str.strip()
 
         # Skip empty, non-sid
-        match = linkedService.isdigit() and len(linkedService) == SERVICE_ID_LEN
-        if not depTime or depTime.lower() == "nan" or not linkedService or linkedService.lower() == "nan" or not match:
-            linkedService = None
-
-        # print(f"Linked to: {linkedService} at {depTime}")
-        return linkedService
+        valid = (
+            linkedService.str.isdigit() & (linkedService.str.len() == SERVICE_ID_LEN) &
+            (depTime != "") & (depTime.str.lower() != "nan")
+        )
+        return [sid if ok else None for sid, ok in zip(linkedService, valid)]
     
     @staticmethod
     def isServiceID(cell): # cell must be str
@@ -1257,101 +1782,343 @@ class TimeTableParser:
     def extractActiveDates(serviceCol):
         pass
 
-    def doRegisterServices(self, sheet, direction, numCols):
-        serviceCols = sheet.columns
-        for col in serviceCols[2:numCols]:
-            idx = serviceCols.get_loc(col)
-            clean = self.cleanCol(sheet, idx)
-            # # print(clean)
-            if (clean.empty):
-                continue
-            # skip repeat STATION columns
-            if (not clean.empty and clean.iloc[0].strip().upper() == "STATIONS"):
-                # print("repeat stations")
-                continue
-
-            # check for an ADAD column
-            vals = clean.dropna().astype(str).str.strip().str.upper().tolist()
-            isADAD = any(a == "A" and b == "D" for a, b in zip(vals, vals[1:]))
-            if(isADAD):
-                # print("adad column, skip") # ideally eliminate from the sheet before
-                continue
-            
-            # if we are here, the column is a service column
-            # extract service ID and 
-            service = Service(ServiceType.REGULAR)
-            service.direction = direction
-            service.rawServiceCol = clean
-
-            sIds, rakeSize, zone, linkName = TimeTableParser.extractServiceHeader(clean)
-            # assign service id(s)
-            if (not len(sIds)): 
-                service.type = ServiceType.STABLING # no SID
-            if (len(sIds) > 1):
-                service.type = ServiceType.MULTI_SERVICE # multiple SIDs
-
-            service.serviceId = sIds
-            service.rakeSizeReq = rakeSize
-            service.zone = zone
-            # service.rakeLinkName = linkName # initially None
-
+    def parseServiceColumn(self, clean, stationRows, idx, direction, linkedTo):
+        '''Everything that can be extracted from a single service column.
+        clean is the column as strings; empty, repeated STATIONS and ADAD
+        columns are already filtered out by SheetIndex.columnKinds.
+        linkedTo comes from extractLinkedTo over the whole sheet.'''
+        # if we are here, the column is a service column
+        # extract service ID and 
+        sIds, rakeSize, zone, linkName = TimeTableParser.extractServiceHeader(clean)
+
+        return ServiceRecord(
+            colIdx=idx,
+            direction=direction,
+            serviceIds=sIds,
+            rakeSize=rakeSize,
+            zone=zone,
             # needs AC?
             # Most AC services have specific dates.
-            service.needsACRake = TimeTableParser.extractACRequirement(clean)
-            # # print(f"{service.serviceId}: {service.needsACRake}")
-
+            needsAC=TimeTableParser.extractACRequirement(clean),
             # retrieve the station path 
-            service.initStation = self.extractInitStation(clean, sheet)
-            # print(f"Init station for {service.serviceId}: {service.initStation.name}")
-
-            service.finalStation = self.extractFinalStation(clean, sheet)
-            # if (service.finalStation):
-            #     print(f"Final Station for {service.serviceId}: {service.finalStation.name}")
-            # else:
-            #     print(f"Could not find final station for {service.serviceId}")
+            initStation=self.extractInitStation(clean, stationRows),
+            finalStation=self.extractFinalStation(clean, stationRows),
+            linkedTo=linkedTo,
+        )
 
-            service.linkedTo = self.extractLinkedToNext(clean, direction)
-            # print(f"Service {service.serviceId} linked to service: {service.linkedTo}")
-            # print(service)
+    def addService(self, rec):
+        '''Create the Service for a ServiceRecord and register it.'''
+        service = Service(ServiceType.REGULAR)
+        service.direction = rec.direction
+        service.colIdx = rec.colIdx
+
+        # assign service id(s)
+        if (not len(rec.serviceIds)): 
+            service.type = ServiceType.STABLING # no SID
+        if (len(rec.serviceIds) > 1):
+            service.type = ServiceType.MULTI_SERVICE # multiple SIDs
+
+        service.serviceId = rec.serviceIds
+        service.rakeSizeReq = rec.rakeSize
+        service.zone = rec.zone
+        # service.rakeLinkName = linkName # initially None
+        service.needsACRake = rec.needsAC
+        service.initStation = rec.initStation
+        service.finalStation = rec.finalStation
+        service.linkedTo = rec.linkedTo
+        # print(f"Service {service.serviceId} linked to service: {service.linkedTo}")
+
+        if rec.direction == Direction.UP:
+            self.wtt.upServices.append(service)
+        elif rec.direction == Direction.DOWN:
+            self.wtt.downServices.append(service)
+        else:
+            print("No other possibility")
 
-            if direction == Direction.UP:
-                self.wtt.upServices.append(service)
-            elif direction == Direction.DOWN:
-                self.wtt.downServices.append(service)
-            else:
-                print("No other possibility")
+    def doRegisterServices(self, sheet, direction, numCols):
+        sheetIdx = self.wtt.sheetIndex(direction)
+        linkedTo = self.extractLinkedTo(sheet, direction)
+        for idx in sheetIdx.serviceColumns(numCols):
+            clean = sheetIdx.cells.iloc[:, idx]
+            rec = self.parseServiceColumn(clean, sheetIdx.stationRows, idx, direction, linkedTo[idx])
+            self.addService(rec)
+
+    def doRegisterServicesParallel(self, sheets, workers):
+        '''Shard the columns of every (sheet, direction, numCols) in `sheets`
+        across a process pool. A shard is the station and A/D columns plus a
+        run of raw columns; the worker indexes that slice and sends back
+        ServiceRecords only, so the parent never builds a SheetIndex here.
+        Records come back in shard order, so the result is identical to
+        registering the sheets one after the other.'''
+        # station objects travel as references, see parseServiceShard
+        stationRefs = {}
+        for key, st in self.stationMap.items():
+            stationRefs[("map", key)] = st
+        for name, st in self.wtt.stations.items():
+            stationRefs[("station", name)] = st
+
+        shards = []
+        for sheet, direction, numCols in sheets:
+            linkedTo = self.extractLinkedTo(sheet, direction)
+            colIdxs = list(range(2, min(numCols, sheet.shape[1]))) # as SheetIndex.serviceColumns
+            size = max(1, -(-len(colIdxs) // (workers * 4))) # a few shards per worker
+            for i in range(0, len(colIdxs), size):
+                part = colIdxs[i:i + size]
+                shards.append((
+                    sheet.iloc[:, [0, 1] + part], direction, part,
+                    [linkedTo[c] for c in part]
+                ))
+
+        # the stations are sent once per worker, not with every shard
+        with ProcessPoolExecutor(max_workers=workers, initializer=initServiceWorker,
+                                 initargs=(self.wtt.stations, self.stationMap)) as pool:
+            results = list(pool.map(parseServiceShard, shards))
+
+        for records in results:
+            for rec in records:
+                rec = rec._replace(
+                    initStation=stationRefs.get(rec.initStation),
+                    finalStation=stationRefs.get(rec.finalStation),
+                )
+                self.addService(rec)
         
     # Regular service columns, we parse:
     # - Stations with arrival and departures.
-    def registerServices(self):
+    def registerServices(self, workers=None):
         '''Enumerate every possible service, extract arrival-departure timings. Populate
-        the Station events. For now, store up and down services seperately
+        the Station events. For now, store up and down services seperately.
+        With workers > 1 the columns are parsed in a process pool.
         '''
-        UP_TT_COLUMNS = 949 # with uniform row indexing, last = 91024
+        start = time.time()
+        if workers is None:
+            workers = TimeTableParser.parseWorkers
         upSheet = self.upSheet
-        self.doRegisterServices(upSheet, Direction.UP, UP_TT_COLUMNS)
-        
-
-        # print("Now register down services")
         downSheet = self.downSheet
-        DOWN_TT_COLUMNS = 982 # with uniform row indexing, last = 91055
-        self.doRegisterServices(downSheet, Direction.DOWN, DOWN_TT_COLUMNS)
-        # print("Down services registered")
+        self.wtt.sheetIndexes = {} # built from the current sheets on first use
+
+        if workers > 1:
+            self.doRegisterServicesParallel([
+                (upSheet, Direction.UP, UP_TT_COLUMNS),
+                (downSheet, Direction.DOWN, DOWN_TT_COLUMNS),
+            ], workers)
+        else:
+            self.doRegisterServices(upSheet, Direction.UP, UP_TT_COLUMNS)
+            # print("Now register down services")
+            self.doRegisterServices(downSheet, Direction.DOWN, DOWN_TT_COLUMNS)
+            # print("Down services registered")
+        self.wtt.indexServices()
+
+        # the string copies were only needed to parse the service columns
+        for sheetIdx in self.wtt.sheetIndexes.values():
+            sheetIdx.cells = None
+
+        logger.info(f"Registered {len(self.wtt.upServices)} up, {len(self.wtt.downServices)} down services "
+                    f"in {time.time() - start:.2f}s ({max(workers, 1)} worker(s))")
 
         # # print(len(TimeTableParser.rakeLinkNames))
         # # print("AL" in TimeTableParser.rakeLinkNames)
 
-        
-if __name__ == "__main__":
-    wttPath = "/home/armaan/Fun-CS/IITB-RAILWAYS-2025/railways-simulator-IITB/SWTT-78_ADDITIONAL_AC_SERVICES_27_NOV_2024-1.xlsx"
-    wttSummaryPath = "/home/armaan/Fun-CS/IITB-RAILWAYS-2025/railways-simulator-IITB/LINK_SWTT_78_UPDATED_05.11.2024-4.xlsx"
-    parsed = TimeTableParser(wttPath, wttSummaryPath)
 
-    parsed.wtt.generateRakeCycles()
+# What registerServices extracts from one service column.
+# Plain data, so it can be returned from worker processes.
+ServiceRecord = namedtuple("ServiceRecord", [
+    "colIdx", "direction", "serviceIds", "rakeSize", "zone",
+    "needsAC", "initStation", "finalStation", "linkedTo",
+])
+
+# a parser with just the state the column extractors need,
+# set up once per worker process by initServiceWorker
+shardParser = None
+
+def initServiceWorker(stations, stationMap):
+    global shardParser
+    shardParser = TimeTableParser()
+    shardParser.stationMap = stationMap
+    shardParser.wtt.stations = stations
+
+def parseServiceShard(shard):
+    '''Worker for TimeTableParser.doRegisterServicesParallel.
+    shard: (sheet, direction, colIdxs, linkedTo), where sheet holds the station
+    and A/D columns followed by the colIdxs columns of the full sheet.
+    Stations in the returned records are ("station", name) / ("map", key) references.'''
+    sheet, direction, colIdxs, linkedTo = shard
+    parser = shardParser
+    stations, stationMap = parser.wtt.stations, parser.stationMap
+
+    refs = {id(st): ("map", key) for key, st in stationMap.items()}
+    refs.update({id(st): ("station", name) for name, st in stations.items()})
+
+    # column kinds are per column, so the slice classifies as the full sheet does
+    sheetIdx = SheetIndex(sheet, stations)
+    records = []
+    for localIdx in sheetIdx.serviceColumns(sheet.shape[1]):
+        clean = sheetIdx.cells.iloc[:, localIdx]
+        rec = parser.parseServiceColumn(clean, sheetIdx.stationRows, colIdxs[localIdx - 2],
+                                        direction, linkedTo[localIdx - 2])
+        records.append(rec._replace(
+            initStation=refs.get(id(rec.initStation)),
+            finalStation=refs.get(id(rec.finalStation)),
+        ))
+    return records
 
-    # parsed.verify()
-    
-    parsed.wtt.printStatistics()
+        
+# Headless command line, no Dash involved:
+#   python3 -m timetable cycles <wtt.xlsx> <summary.xlsx> -o cycles.csv
+# Parse progress is printed to stderr, results go to stdout or -o.
+
+def loadTimeTable(wttPath, summaryPath, generate=False, useCache=True):
+    '''Parse a (wtt, summary) pair, optionally generating rake cycles.
+    Returns the parser and the time taken by each stage.'''
+    timings = {}
+    start = time.time()
+    with open(wttPath, "rb") as f1, open(summaryPath, "rb") as f2:
+        parser = TimeTableParser.fromFileObjects(f1, f2, useCache=useCache)
+    timings["parse"] = time.time() - start
+
+    if generate and not parser.wtt.rakeCyclesGenerated:
+        start = time.time()
+        parser.wtt.generateRakeCycles()
+        timings["cycles"] = time.time() - start
+        if useCache:
+            parser.saveToCache()
+    return parser, timings
+
+def serviceRecords(wtt):
+    return [{
+        "serviceId": sv.serviceId,
+        "direction": sv.direction.value,
+        "type": sv.type.value,
+        "zone": sv.zone.value if sv.zone else None,
+        "ac": bool(sv.needsACRake),
+        "rakeSize": sv.rakeSizeReq,
+        "initStation": sv.initStation.name if sv.initStation else None,
+        "finalStation": sv.finalStation.name if sv.finalStation else None,
+        "linkedTo": sv.linkedTo,
+    } for sv in wtt.upServices + wtt.downServices]
+
+def cycleRecords(wtt):
+    records = []
+    for rc in wtt.rakecycles:
+        path = rc.servicePath or []
+        records.append({
+            "linkName": rc.linkName,
+            "rake": rc.rake.rakeId if rc.rake else None,
+            "ac": bool(rc.rake and rc.rake.isAC),
+            "lengthKm": rc.lengthKm,
+            "start": path[0].events[0].atStation if path and path[0].events else None,
+            "end": path[-1].events[-1].atStation if path and path[-1].events else None,
+            "serviceIds": [sv.serviceId[0] for sv in path],
+        })
+    return records
+
+def eventRecords(wtt):
+    records = []
+    for rc in wtt.rakecycles:
+        for sv in rc.servicePath or []:
+            for e in sv.events:
+                records.append({
+                    "linkName": rc.linkName,
+                    "serviceId": sv.serviceId[0],
+                    "station": e.atStation,
+                    "minutes": e.atTime,
+                    "type": e.eType.name if e.eType else None,
+                })
+    return records
+
+def writeRecords(records, out, fmt):
+    '''Write a list of flat dicts as JSON or CSV; list values are space separated in CSV.'''
+    import csv
+    import json
+    if fmt == "json":
+        json.dump(records, out, indent=2, default=str, ensure_ascii=False)
+        out.write("\n")
+        return
+    writer = csv.DictWriter(out, fieldnames=list(records[0].keys()) if records else [])
+    writer.writeheader()
+    for rec in records:
+        writer.writerow({k: " ".join(map(str, v)) if isinstance(v, list) else v for k, v in rec.items()})
+
+def main(argv=None):
+    import argparse
+    import contextlib
+    import sys
+
+    cli = argparse.ArgumentParser(prog="timetable", description="Parse a WTT and its Link Summary without the dashboard.")
+    sub = cli.add_subparsers(dest="command", required=True)
+    for name, help in [
+        ("parse", "services registered from the WTT"),
+        ("cycles", "rake links with their service paths"),
+        ("stats", "timetable summary statistics"),
+        ("export", "station events of every rake link"),
+        ("diff", "changes between two WTT revisions"),
+    ]:
+        cmd = sub.add_parser(name, help=help)
+        if name == "diff":
+            cmd.add_argument("oldWtt")
+            cmd.add_argument("oldSummary")
+        cmd.add_argument("wtt")
+        cmd.add_argument("summary")
+        cmd.add_argument("-o", "--output", help="output file (default stdout)")
+        cmd.add_argument("-f", "--format", choices=["json", "csv"], help="default: from the output extension, else json")
+        cmd.add_argument("--no-cache", action="store_true", help="do not read or write the parse cache")
+        cmd.add_argument("--workers", type=int, help="processes for registerServices (default WTT_PARSE_WORKERS)")
+        cmd.add_argument("-v", "--verbose", action="store_true", help="show parser logs")
+    args = cli.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.DEBUG if args.verbose else logging.WARNING)
+    if args.workers is not None:
+        TimeTableParser.parseWorkers = args.workers
+    fmt = args.format or ("csv" if args.output and args.output.endswith(".csv") else "json")
+    useCache = not args.no_cache
+    generate = args.command in ("cycles", "stats", "export")
+
+    # the parser prints progress, keep stdout for results
+    with contextlib.redirect_stdout(sys.stderr):
+        parser, timings = loadTimeTable(args.wtt, args.summary, generate, useCache)
+        wtt = parser.wtt
+        if args.command == "diff":
+            from wttdiff import TimeTableDiff
+            old, oldTimings = loadTimeTable(args.oldWtt, args.oldSummary, False, useCache)
+            timings["parse old"] = oldTimings["parse"]
+            start = time.time()
+            diff = TimeTableDiff(old.wtt, wtt)
+            timings["diff"] = time.time() - start
+
+    out = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        if args.command == "diff":
+            if fmt == "csv":
+                diff.toCsv(out)
+            else:
+                diff.toJson(out)
+                out.write("\n")
+        elif args.command == "stats":
+            stats = TimeTableStats(wtt)
+            if fmt == "json":
+                import json
+                json.dump(stats.toDict(), out, indent=2, ensure_ascii=False)
+                out.write("\n")
+            else:
+                writeRecords(stats.toRecords(), out, fmt)
+        else:
+            records = {
+                "parse": serviceRecords,
+                "cycles": cycleRecords,
+                "export": eventRecords,
+            }[args.command](wtt)
+            writeRecords(records, out, fmt)
+    finally:
+        if args.output:
+            out.close()
+
+    print(", ".join(f"{stage}: {t:.2f}s" for stage, t in timings.items()), file=sys.stderr)
+
+if __name__ == "__main__":
+    # Run against the importable module rather than __main__, so that
+    # pickled cache entries, worker processes and enums all see the same
+    # `timetable` classes as the dashboard does.
+    import timetable
+    timetable.main()
 
 
 # Summary Sheet
@@ -23,14 +23,13 @@ def getCorridorStations(start, end, distanceMap):
     return stations[i_end:i_start + 1][::-1]
 
 
-def getStationEvents(station, t_lower, t_upper):
+def getStationEvents(wtt, station, t_lower, t_upper):
     '''
-    Return station events in [t_lower, t_upper], sorted by atTime.
+    Return station events of the TimeTable wtt in [t_lower, t_upper], sorted by atTime.
     '''
-    events = TimeTableParser.eventsByStationMap.get(station, [])
-    evs = [e for e in events if e.atTime is not None and t_lower <= e.atTime <= t_upper]
-    evs.sort(key=lambda e: e.atTime)
-    return evs
+    if wtt.eventTable is None:
+        return [] # rake cycles not generated yet
+    return wtt.stationEventsInWindow(station, t_lower, t_upper)
 
 
 def getStationSequence(events):
@@ -190,16 +189,16 @@ def analyzeSequence(seq):
 
 # reporting helpers
 
-def stationMixingReport(station, t_lower, t_upper):
+def stationMixingReport(wtt, station, t_lower, t_upper):
     '''
-    Compute full mixing report for a station in the given time window.
+    Compute full mixing report for a station of the TimeTable wtt in the given time window.
     Returns a list of per-station metric dicts across the ANDHERI->CHURCHGATE corridor.
     '''
     stations = getCorridorStations('ANDHERI', 'CHURCHGATE', TimeTableParser.distanceMap)
     metricslist = []
 
     for st in stations:
-        events = getStationEvents(st, t_lower, t_upper)
+        events = getStationEvents(wtt, st, t_lower, t_upper)
         seq = getStationSequence(events)
         metrics = analyzeSequence(seq)
 
@@ -226,9 +225,9 @@ def stationMixingReport(station, t_lower, t_upper):
     return metricslist
 
 
-def corridorMixingMinimal(start_station, end_station, t_lower, t_upper):
+def corridorMixingMinimal(wtt, start_station, end_station, t_lower, t_upper):
     '''
-    Return a minimal mixing report for corridor analysis:
+    Return a minimal mixing report for corridor analysis of the TimeTable wtt:
     per-station mixing_score, alternation_ratio, ideal_alternation_ratio.
     '''
     if not start_station or not end_station:
@@ -240,7 +239,7 @@ def corridorMixingMinimal(start_station, end_station, t_lower, t_upper):
     result = []
 
     for s in stations:
-        events = getStationEvents(s, t_lower, t_upper)
+        events = getStationEvents(wtt, s, t_lower, t_upper)
         seq = getStationSequence(events)
         m = analyzeSequence(seq)
 
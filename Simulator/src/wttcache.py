@@ -0,0 +1,117 @@
+# wttcache.py — on-disk cache of parsed timetables
+#
+# Parsing a full WTT (Excel load + registerServices over ~1900 columns)
+# takes tens of seconds. The parsed state is pickled to disk, keyed by
+# a hash of the uploaded workbook bytes, so re-uploading the same
+# SWTT/Link-summary pair is a single unpickle.
+import hashlib
+import logging
+import os
+import pickle
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the pickled classes change shape, so stale
+# entries written by an older version are never loaded.
+CACHE_FORMAT = "wtt-cache-18"
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "railways-simulator")
+DEFAULT_MAX_MB = 512
+
+
+class ParseCache:
+    '''Least-recently-used cache of pickled objects on disk, bounded by total size.
+    Recency is tracked through file mtimes, so it survives restarts.'''
+    def __init__(self, cacheDir=None, maxBytes=None):
+        self.cacheDir = cacheDir or os.environ.get("WTT_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if maxBytes is None:
+            maxBytes = int(os.environ.get("WTT_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024
+        self.maxBytes = maxBytes
+
+    @staticmethod
+    def keyFor(*blobs):
+        '''Hash of the given byte strings, in order.'''
+        h = hashlib.sha256(CACHE_FORMAT.encode())
+        for b in blobs:
+            # length prefix, so (ab, c) and (a, bc) hash differently
+            h.update(len(b).to_bytes(8, "little"))
+            h.update(b)
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cacheDir, f"{key}.pkl")
+
+    def load(self, key):
+        '''Return the cached object for key, or None on a miss.'''
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                obj = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # truncated/incompatible entry, drop it
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+        # mark as most recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return obj
+
+    def store(self, key, obj):
+        os.makedirs(self.cacheDir, exist_ok=True)
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path) # atomic, readers never see a partial file
+        except Exception as e:
+            logger.warning(f"Could not write cache entry {path}: {e}")
+            self._remove(tmp)
+            return
+        self.evict(keep=path)
+
+    def evict(self, keep=None):
+        '''Remove least recently used entries until the cache fits in maxBytes.
+        `keep` (the entry just written) is never evicted.'''
+        entries = []
+        try:
+            names = os.listdir(self.cacheDir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.cacheDir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.maxBytes:
+                break
+            if path == keep:
+                continue
+            logger.debug(f"Evicting cache entry {path}")
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.cacheDir) if os.path.isdir(self.cacheDir) else []:
+            if name.endswith(".pkl"):
+                self._remove(os.path.join(self.cacheDir, name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
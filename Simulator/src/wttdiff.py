@@ -0,0 +1,178 @@
+# wttdiff.py — compare two parsed WTT revisions
+#
+# SWTT revisions (e.g. SWTT-78 and its "additional AC services" update)
+# are parsed independently; TimeTableDiff matches their services by
+# service ID and lists what changed between them.
+import csv
+import io
+import json
+import logging
+import math
+import time
+from enum import Enum
+
+from timetable import serviceKey
+
+logger = logging.getLogger(__name__)
+
+
+class DiffKind(Enum):
+    ADDED = 'added' # service only in the new timetable
+    REMOVED = 'removed' # service only in the old timetable
+    RETIMED = 'retimed' # station timings differ
+    LINKED_TO = 'linked-to' # different service after reversal
+    AC = 'ac' # needsACRake flipped
+    LINK_ADDED = 'link-added' # rake link only in the new summary
+    LINK_REMOVED = 'link-removed' # rake link only in the old summary
+    LINK_CHANGED = 'link-changed' # rake link runs a different service sequence
+
+
+class Change:
+    '''One difference. `key` is a service ID or a rake link name;
+    old/new are the values on either side (None if absent).'''
+    __slots__ = ("kind", "key", "old", "new")
+
+    def __init__(self, kind, key, old=None, new=None):
+        self.kind = kind
+        self.key = key
+        self.old = old
+        self.new = new
+
+    def __repr__(self):
+        return f"<{self.kind.value} {self.key}: {self.old} -> {self.new}>"
+
+
+def formatMinutes(m):
+    if m is None:
+        return "?"
+    m = int(round(m)) % 1440
+    return f"{m // 60:02d}:{m % 60:02d}"
+
+
+def servicesById(wtt):
+    '''serviceKey(first service ID) -> Service; services without an ID are skipped.'''
+    services = {}
+    for sv in wtt.upServices + wtt.downServices:
+        if sv.serviceId:
+            services.setdefault(serviceKey(sv.serviceId[0]), sv)
+    return services
+
+
+def serviceTimings(wtt, sv):
+    '''{(station, event type, n): minutes} of every time cell in the service's column,
+    read from the sheet index, so services without generated events compare too.
+    A reversal row's time belongs to the station before it, as in
+    generateStationEvents; n counts repeats of the same (station, type).'''
+    sheetIdx = wtt.sheetIndex(sv.direction)
+    stationRows = sheetIdx.stationRows
+    timings = {}
+    station = None
+    for row in sheetIdx.timeRows(sv.colIdx):
+        if not stationRows.reversal[row] or station is None:
+            station = stationRows.names[row]
+        eType = sheetIdx.eventType(row).name
+        n = 0
+        while (station, eType, n) in timings:
+            n += 1
+        m = sheetIdx.minutes[row, sv.colIdx]
+        timings[(station, eType, n)] = None if math.isnan(m) else float(m)
+    return timings
+
+
+class TimeTableDiff:
+    '''Differences between two parsed TimeTables, old -> new.
+    Services are joined on their (first) service ID, rake links on their name.'''
+    def __init__(self, old, new):
+        start = time.time()
+        self.old = old
+        self.new = new
+        self.changes = []
+
+        oldServices = servicesById(old)
+        newServices = servicesById(new)
+
+        for sid, sv in newServices.items():
+            if sid not in oldServices:
+                self.changes.append(Change(DiffKind.ADDED, sid, new=sv.direction.value))
+        for sid, sv in oldServices.items():
+            if sid not in newServices:
+                self.changes.append(Change(DiffKind.REMOVED, sid, old=sv.direction.value))
+
+        for sid, newSv in newServices.items():
+            oldSv = oldServices.get(sid)
+            if oldSv is None:
+                continue
+            self.diffService(sid, oldSv, newSv)
+
+        self.diffRakeLinks()
+        logger.info(f"Diffed {len(oldServices)} -> {len(newServices)} services: {len(self.changes)} changes in {time.time() - start:.3f}s")
+
+    def diffService(self, sid, oldSv, newSv):
+        oldTimes = serviceTimings(self.old, oldSv)
+        newTimes = serviceTimings(self.new, newSv)
+        if oldTimes != newTimes:
+            # only the (station, type) timings that changed, in the new service's order
+            keys = [k for k in newTimes if oldTimes.get(k) != newTimes[k]]
+            keys += [k for k in oldTimes if k not in newTimes]
+            self.changes.append(Change(
+                DiffKind.RETIMED, sid,
+                old=[(st, eType, oldTimes.get((st, eType, n))) for st, eType, n in keys],
+                new=[(st, eType, newTimes.get((st, eType, n))) for st, eType, n in keys],
+            ))
+
+        oldLink = serviceKey(oldSv.linkedTo) if oldSv.linkedTo else None
+        newLink = serviceKey(newSv.linkedTo) if newSv.linkedTo else None
+        if oldLink != newLink:
+            self.changes.append(Change(DiffKind.LINKED_TO, sid, oldLink, newLink))
+
+        if bool(oldSv.needsACRake) != bool(newSv.needsACRake):
+            self.changes.append(Change(DiffKind.AC, sid, bool(oldSv.needsACRake), bool(newSv.needsACRake)))
+
+    def diffRakeLinks(self):
+        oldLinks = {rc.linkName: [serviceKey(sid) for sid in rc.serviceIds] for rc in self.old.rakecycles}
+        newLinks = {rc.linkName: [serviceKey(sid) for sid in rc.serviceIds] for rc in self.new.rakecycles}
+        for name, sids in newLinks.items():
+            if name not in oldLinks:
+                self.changes.append(Change(DiffKind.LINK_ADDED, name, new=sids))
+            elif oldLinks[name] != sids:
+                self.changes.append(Change(DiffKind.LINK_CHANGED, name, oldLinks[name], sids))
+        for name, sids in oldLinks.items():
+            if name not in newLinks:
+                self.changes.append(Change(DiffKind.LINK_REMOVED, name, old=sids))
+
+    def byKind(self, kind):
+        return [c for c in self.changes if c.kind == kind]
+
+    def summary(self):
+        '''Number of changes of each kind.'''
+        return {kind.value: len(self.byKind(kind)) for kind in DiffKind}
+
+    @staticmethod
+    def formatValue(value):
+        if isinstance(value, list) and value and isinstance(value[0], tuple):
+            # retimed (station, event type, minutes)
+            return "; ".join(f"{st} {eType[0]} {formatMinutes(m)}" for st, eType, m in value)
+        if isinstance(value, list):
+            return " ".join(str(v) for v in value)
+        return "" if value is None else str(value)
+
+    def toRecords(self):
+        return [{"kind": c.kind.value, "key": str(c.key),
+                 "old": self.formatValue(c.old), "new": self.formatValue(c.new)}
+                for c in self.changes]
+
+    def toJson(self, fp=None):
+        '''Summary and changes as JSON, written to fp if given, else returned.'''
+        doc = {"summary": self.summary(), "changes": self.toRecords()}
+        if fp is None:
+            return json.dumps(doc, indent=2, ensure_ascii=False)
+        json.dump(doc, fp, indent=2, ensure_ascii=False)
+
+    def toCsv(self, fp=None):
+        '''One row per change, written to fp if given, else returned.'''
+        out = fp or io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=["kind", "key", "old", "new"])
+        writer.writeheader()
+        writer.writerows(self.toRecords())
+        if fp is None:
+            return out.getvalue()
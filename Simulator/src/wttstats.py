@@ -0,0 +1,117 @@
+# wttstats.py — summary statistics of a parsed timetable
+#
+# Counts come from the service lists; anything timed (services running
+# in a window, per-hour counts, station throughput) is computed with
+# numpy over the TimeTable's EventTable, so it is only available once
+# generateRakeCycles has run.
+import numpy as np
+
+
+class TimeTableStats:
+    '''Statistics of a TimeTable.
+    window: (t_lower, t_upper) in minutes for servicesInWindow, default the whole day.'''
+    def __init__(self, wtt, window=None):
+        services = wtt.upServices + wtt.downServices
+        suburban = wtt.suburbanServices or []
+
+        # 1-4. services by direction and AC requirement
+        self.totalServices = len(services)
+        self.upServices = len(wtt.upServices)
+        self.downServices = len(wtt.downServices)
+        self.acServices = sum(1 for sv in services if sv.needsACRake)
+        self.suburbanServices = len(suburban)
+        self.suburbanACServices = sum(1 for sv in suburban if sv.needsACRake)
+
+        # rake links
+        self.rakeLinks = len(wtt.rakecycles)
+        self.conflictingLinks = len(wtt.conflictingLinks)
+        self.linkKm = {rc.linkName: rc.lengthKm for rc in wtt.rakecycles} # linkName: km
+        self.totalKm = sum(self.linkKm.values())
+
+        # what is currently rendered in the dashboard
+        rendered = [rc for rc in wtt.rakecycles if rc.render]
+        self.renderedLinks = len(rendered)
+        self.renderedLinkKm = {rc.linkName: rc.lengthKm for rc in rendered}
+        self.renderedLinkServices = sum(len(rc.servicePath or []) for rc in rendered)
+        self.renderedACServices = sum(
+            1 for rc in rendered for sv in rc.servicePath or [] if sv.needsACRake and sv.render
+        )
+        self.renderedServices = sum(1 for sv in suburban if sv.render)
+
+        # 5. timed statistics over the events
+        self.window = window
+        self.servicesInWindow = None
+        self.servicesPerHour = {} # hour (0-27, past midnight runs on): services running
+        self.stationEvents = {} # station: events
+        self.stationServices = {} # station: distinct services calling
+        table = wtt.eventTable
+        if table is not None and len(table):
+            self.computeTimed(table, window)
+
+    def computeTimed(self, table, window):
+        first, last = table.serviceSpans()
+        timed = ~np.isnan(first)
+        first, last = first[timed], last[timed]
+
+        lo, hi = window if window else (-np.inf, np.inf)
+        self.servicesInWindow = int(np.count_nonzero((first <= hi) & (last >= lo)))
+
+        # a service runs in every hour from its first to its last event
+        if len(first):
+            h0 = (first // 60).astype(np.int64)
+            h1 = (last // 60).astype(np.int64)
+            counts = np.zeros(int(h1.max()) + 2, dtype=np.int64)
+            np.add.at(counts, h0, 1)
+            np.add.at(counts, h1 + 1, -1)
+            counts = np.cumsum(counts)[:-1]
+            self.servicesPerHour = {h: int(c) for h, c in enumerate(counts) if c}
+
+        names = table.stationNames
+        perStation = np.bincount(table.station, minlength=len(names))
+        pairs = np.unique(table.station.astype(np.int64) * len(table.services) + table.service)
+        distinct = np.bincount(pairs // len(table.services), minlength=len(names))
+        self.stationEvents = {names[j]: int(perStation[j]) for j in range(len(names)) if perStation[j]}
+        self.stationServices = {names[j]: int(distinct[j]) for j in range(len(names)) if distinct[j]}
+
+    def toDict(self):
+        return {
+            "totalServices": self.totalServices,
+            "upServices": self.upServices,
+            "downServices": self.downServices,
+            "acServices": self.acServices,
+            "suburbanServices": self.suburbanServices,
+            "suburbanACServices": self.suburbanACServices,
+            "rakeLinks": self.rakeLinks,
+            "conflictingLinks": self.conflictingLinks,
+            "totalKm": self.totalKm,
+            "window": list(self.window) if self.window else None,
+            "servicesInWindow": self.servicesInWindow,
+            "servicesPerHour": self.servicesPerHour,
+            "stationEvents": self.stationEvents,
+            "stationServices": self.stationServices,
+            "linkKm": self.linkKm,
+        }
+
+    def toRecords(self):
+        '''Flat (metric, key, value) rows, for CSV.'''
+        records = []
+        for metric, value in self.toDict().items():
+            if isinstance(value, dict):
+                records += [{"metric": metric, "key": k, "value": v} for k, v in value.items()]
+            else:
+                records.append({"metric": metric, "key": "", "value": value})
+        return records
+
+    def __str__(self):
+        lines = [
+            f"Services: {self.totalServices} ({self.upServices} up, {self.downServices} down), {self.acServices} AC",
+            f"Suburban services: {self.suburbanServices}, {self.suburbanACServices} AC",
+            f"Rake links: {self.rakeLinks}, {self.conflictingLinks} conflicting, {self.totalKm:.1f} km in total",
+        ]
+        if self.servicesInWindow is not None:
+            lines.append(f"Services running in {self.window or 'the day'}: {self.servicesInWindow}")
+            lines.append("Services per hour: " + ", ".join(
+                f"{h % 24:02d}h {c}" for h, c in self.servicesPerHour.items()))
+            busiest = sorted(self.stationServices.items(), key=lambda kv: kv[1], reverse=True)[:5]
+            lines.append("Busiest stations: " + ", ".join(f"{st} ({n})" for st, n in busiest))
+        return "\n".join(lines)